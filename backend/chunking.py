@@ -0,0 +1,152 @@
+import os
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Target chunk length in characters; chunks end early at a section, page or sentence boundary
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "2000"))
+
+# A sentence ends at . ! or ? (optionally closed by a quote or bracket) followed by whitespace
+_SENTENCE_END_RE = re.compile(r"[.!?][\"')\]]?\s+")
+
+_SECTION_NAMES = (
+    r"Abstract|Introduction|Background|Related Work|Materials and Methods|Methodology|Methods|"
+    r"Experiments|Experimental Setup|Evaluation|Results|Discussion|Conclusions?|Future Work|"
+    r"Limitations|Acknowledge?ments|References|Bibliography|Appendix"
+)
+# Headings survive whitespace normalisation only as inline text, so accept the
+# forms that are unlikely inside a sentence: numbered ("2.1 Methods") or upper case
+_SECTION_RE = re.compile(
+    rf"(?:(?<=\s)|^)(?:(?P<number>\d+(?:\.\d+)*\.?)\s+(?P<name>{_SECTION_NAMES})"
+    rf"|(?P<upper>{_SECTION_NAMES.upper()}))(?=\s+[A-Z0-9(\[]|$)"
+)
+
+
+class ChunkTable:
+    """Chunk boundaries of one document as compact offset arrays.
+
+    Chunk ``i`` is ``text[starts[i]:ends[i]]``; nothing but offsets is stored,
+    so consumers slice the chunks they need out of the document text instead
+    of re-splitting it. ``pages`` holds the 1-based page a chunk starts on
+    (0 when unknown) and ``sections`` an index into ``section_titles``
+    (-1 before the first detected heading).
+    """
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, pages: np.ndarray, sections: np.ndarray,
+                 section_titles: List[str]):
+        self.starts = starts
+        self.ends = ends
+        self.pages = pages
+        self.sections = sections
+        self.section_titles = section_titles
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def chunk(self, text: str, i: int) -> str:
+        return text[self.starts[i]:self.ends[i]]
+
+    def texts(self, text: str, ids: Optional[Sequence[int]] = None) -> List[str]:
+        """Chunk strings for the given ids (all chunks by default)."""
+        ids = range(len(self)) if ids is None else ids
+        return [text[self.starts[i]:self.ends[i]] for i in ids]
+
+    def page(self, i: int) -> Optional[int]:
+        return int(self.pages[i]) or None
+
+    def section(self, i: int) -> Optional[str]:
+        index = int(self.sections[i])
+        return self.section_titles[index] if index >= 0 else None
+
+    def citation(self, i: int) -> Dict:
+        """Where chunk i sits in the document: offsets, page and section."""
+        return {
+            "chunk_id": int(i),
+            "start": int(self.starts[i]),
+            "end": int(self.ends[i]),
+            "page": self.page(i),
+            "section": self.section(i),
+        }
+
+
+def detect_sections(text: str) -> List[tuple]:
+    """Return (offset, title) for headings found in whitespace-normalised text."""
+    sections = []
+    for match in _SECTION_RE.finditer(text):
+        if match.group("upper"):
+            title = match.group("upper").title()
+        else:
+            title = f"{match.group('number')} {match.group('name')}"
+        sections.append((match.start(), title))
+    return sections
+
+
+def build_chunk_table(text: str, page_offsets: Optional[List[int]] = None,
+                      chunk_size: int = CHUNK_SIZE) -> ChunkTable:
+    """Split text into chunks of at most chunk_size characters at the best nearby boundary.
+
+    A chunk never runs past the start of a new section. Otherwise, within the
+    second half of each window the cut prefers, in order, the start of a page,
+    the end of a sentence, and a space; only text with no boundary at all is
+    cut mid-word. Runs once per document, in linear time.
+    """
+    n = len(text)
+    sections = detect_sections(text)
+    section_starts = [offset for offset, _ in sections]
+    page_starts = sorted(set(page_offsets or []))
+    sentence_ends = [match.end() for match in _SENTENCE_END_RE.finditer(text)]
+
+    starts: List[int] = []
+    ends: List[int] = []
+    start = 0
+    while start < n:
+        # Skip the separator left by the previous cut
+        while start < n and text[start] == " ":
+            start += 1
+        if start >= n:
+            break
+        limit = start + chunk_size
+        if limit >= n:
+            end = n
+        else:
+            lower = start + chunk_size // 2
+            end = (
+                _first_between(section_starts, start, limit)
+                or _last_between(page_starts, lower, limit)
+                or _last_between(sentence_ends, lower, limit)
+            )
+            if not end:
+                space = text.rfind(" ", lower, limit)
+                end = space + 1 if space > start else limit
+        stop = end
+        while stop > start and text[stop - 1] == " ":
+            stop -= 1
+        starts.append(start)
+        ends.append(stop)
+        start = end
+
+    starts_array = np.array(starts, dtype=np.int64)
+    pages = np.zeros(len(starts), dtype=np.int32)
+    if page_offsets:
+        pages[:] = [bisect_right(page_offsets, offset) for offset in starts]
+    section_ids = np.array([bisect_right(section_starts, offset) - 1 for offset in starts], dtype=np.int32)
+    return ChunkTable(starts_array, np.array(ends, dtype=np.int64), pages,
+                      section_ids, [title for _, title in sections])
+
+
+def _first_between(boundaries: List[int], lower: int, upper: int) -> Optional[int]:
+    """Smallest boundary in (lower, upper], or None."""
+    i = bisect_right(boundaries, lower)
+    if i < len(boundaries) and boundaries[i] <= upper:
+        return boundaries[i]
+    return None
+
+
+def _last_between(boundaries: List[int], lower: int, upper: int) -> Optional[int]:
+    """Largest boundary in (lower, upper], or None."""
+    i = bisect_right(boundaries, upper)
+    if i and boundaries[i - 1] > lower:
+        return boundaries[i - 1]
+    return None
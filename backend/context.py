@@ -0,0 +1,140 @@
+import math
+import os
+from typing import List, NamedTuple, Sequence, Set
+
+from backend.retrieval import tokenize
+from backend.utils import count_words, split_sentences
+
+# Prompt budget for retrieved context, in model tokens
+QA_CONTEXT_TOKENS = int(os.getenv("QA_CONTEXT_TOKENS", "1000"))
+# Tokens per whitespace-separated word for the target model (~1.3 for English with BPE tokenizers)
+CONTEXT_TOKENS_PER_WORD = float(os.getenv("CONTEXT_TOKENS_PER_WORD", "1.3"))
+
+# Two sentences are duplicates when this share of the shorter one's terms occurs in the other
+_DUPLICATE_CONTAINMENT = 0.8
+# Sentences scoring below this share of the best one only match incidental terms
+_MIN_RELATIVE_SCORE = 0.25
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def estimate_tokens(text: str, tokens_per_word: float = CONTEXT_TOKENS_PER_WORD) -> int:
+    return math.ceil(count_words(text) * tokens_per_word)
+
+
+class PackedContext(NamedTuple):
+    text: str
+    passages: List[int]  # indices of the passages that contributed, in input order
+    tokens: int
+
+
+class _Sentence:
+    __slots__ = ("passage", "position", "text", "terms", "tokens", "score")
+
+    def __init__(self, passage: int, position: int, text: str, tokens_per_word: float):
+        self.passage = passage
+        self.position = position
+        self.text = text
+        self.terms: Set[str] = set(tokenize(text))
+        self.tokens = estimate_tokens(text, tokens_per_word)
+        self.score = 0.0
+
+
+def pack_context(question: str, passages: Sequence[str], budget: int = QA_CONTEXT_TOKENS,
+                 tokens_per_word: float = CONTEXT_TOKENS_PER_WORD) -> PackedContext:
+    """Compress ranked passages into at most ``budget`` tokens of question-relevant sentences.
+
+    Passages come best first. Sentences are scored against the question with
+    BM25 over the candidate sentences, and those matching only incidental
+    terms are left out; repeated sentences (and fragments of
+    sentences already taken, e.g. from overlapping chunks) are dropped. The
+    best sentences are packed greedily, then their neighbours while budget is
+    left so the kept text still reads coherently. Output follows passage and
+    sentence order; skipped text is marked with "[...]".
+    """
+    sentences = [
+        _Sentence(p, i, sentence, tokens_per_word)
+        for p, passage in enumerate(passages)
+        for i, sentence in enumerate(split_sentences(passage))
+    ]
+    if not sentences:
+        return PackedContext("", [], 0)
+    _score(sentences, set(tokenize(question)))
+
+    by_relevance = sorted(sentences, key=lambda s: (-s.score, s.passage, s.position))
+    if by_relevance[0].score == 0:
+        # Nothing matches the question: keep the lead of the best passages
+        by_relevance = sorted(sentences, key=lambda s: (s.passage, s.position))
+
+    selected: List[_Sentence] = []
+    used = 0
+
+    def take(sentence: _Sentence) -> None:
+        nonlocal used
+        if used + sentence.tokens > budget or _is_duplicate(sentence, selected):
+            return
+        selected.append(sentence)
+        used += sentence.tokens
+
+    threshold = by_relevance[0].score * _MIN_RELATIVE_SCORE
+    for sentence in by_relevance:
+        if sentence.score > threshold or by_relevance[0].score == 0:
+            take(sentence)
+    # Neighbours of the kept sentences, most relevant first, while budget remains
+    neighbours = {(s.passage, s.position): s for s in sentences}
+    for sentence in list(selected):
+        for offset in (-1, 1):
+            neighbour = neighbours.get((sentence.passage, sentence.position + offset))
+            if neighbour is not None and neighbour not in selected:
+                take(neighbour)
+
+    if not selected:
+        # A single sentence longer than the budget: keep its first words
+        best = by_relevance[0]
+        words = best.text.split()[:max(1, int(budget / tokens_per_word))]
+        best.text = " ".join(words)
+        best.tokens = estimate_tokens(best.text, tokens_per_word)
+        selected, used = [best], best.tokens
+
+    return PackedContext(_render(selected), sorted({s.passage for s in selected}), used)
+
+
+def _score(sentences: List[_Sentence], query_terms: Set[str]) -> None:
+    n = len(sentences)
+    avg_len = sum(len(s.terms) for s in sentences) / n or 1.0
+    for term in query_terms:
+        containing = [s for s in sentences if term in s.terms]
+        if not containing:
+            continue
+        idf = math.log(1 + (n - len(containing) + 0.5) / (len(containing) + 0.5))
+        for s in containing:
+            # Terms are counted once per sentence, so tf is 1
+            norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * len(s.terms) / avg_len)
+            s.score += idf * (_BM25_K1 + 1) / (1 + norm)
+
+
+def _is_duplicate(sentence: _Sentence, selected: List[_Sentence]) -> bool:
+    for other in selected:
+        if sentence.text == other.text:
+            return True
+        smaller = min(len(sentence.terms), len(other.terms))
+        if smaller >= 4 and len(sentence.terms & other.terms) >= _DUPLICATE_CONTAINMENT * smaller:
+            return True
+    return False
+
+
+def _render(selected: List[_Sentence]) -> str:
+    ordered = sorted(selected, key=lambda s: (s.passage, s.position))
+    blocks: List[str] = []
+    current: List[str] = []
+    previous = None
+    for sentence in ordered:
+        if previous is not None and sentence.passage != previous.passage:
+            blocks.append(" ".join(current))
+            current = []
+        elif previous is not None and sentence.position != previous.position + 1:
+            current.append("[...]")
+        current.append(sentence.text)
+        previous = sentence
+    blocks.append(" ".join(current))
+    return "\n\n".join(blocks)
@@ -0,0 +1,167 @@
+import heapq
+import math
+import os
+import threading
+from typing import Dict, List, Set
+
+import numpy as np
+
+from backend.chunking import ChunkTable
+from backend.retrieval import BM25Index, tokenize, top_k_from_scores
+
+# Passages returned by /search and packed into /ask_corpus prompts
+CORPUS_TOP_K = int(os.getenv("CORPUS_TOP_K", "5"))
+
+
+class CorpusShard:
+    """One document's postings with the idf factored out, so idf can be corpus-wide.
+
+    Built from the document's BM25Index without re-tokenising: the stored
+    weights are divided by the per-document idf, leaving the length-normalised
+    term-frequency part of BM25.
+    """
+
+    def __init__(self, lexical: BM25Index, chunks: ChunkTable):
+        df = np.diff(lexical.offsets)
+        n = lexical.num_chunks
+        local_idf = np.log(1 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        self.vocab = lexical.vocab
+        self.offsets = lexical.offsets
+        self.chunk_ids = lexical.chunk_ids
+        self.tf_weights = lexical.weights / np.repeat(local_idf, df)
+        self.doc_freqs = df
+        self.num_chunks = n
+        # Best weight per term, for the upper bound used to skip whole documents
+        self.max_weights = (
+            np.maximum.reduceat(self.tf_weights, lexical.offsets[:-1])
+            if len(self.tf_weights) else np.zeros(0, dtype=np.float32)
+        )
+        self.chunks = chunks
+
+    def upper_bound(self, term_idf: Dict[str, float]) -> float:
+        bound = 0.0
+        for term, idf in term_idf.items():
+            term_id = self.vocab.get(term)
+            if term_id is not None:
+                bound += idf * float(self.max_weights[term_id])
+        return bound
+
+    def scores(self, term_idf: Dict[str, float]) -> np.ndarray:
+        scores = np.zeros(self.num_chunks, dtype=np.float32)
+        for term, idf in term_idf.items():
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            scores[self.chunk_ids[start:end]] += idf * self.tf_weights[start:end]
+        return scores
+
+
+class CorpusIndex:
+    """Lexical index over every uploaded document, sharded per document.
+
+    Document frequencies are kept corpus-wide so scores are comparable across
+    shards, and a term -> documents map restricts a query to documents that
+    contain at least one query term. Candidates are visited in order of their
+    best possible score and the scan stops once no remaining document can
+    beat the current top-k. Documents are added and removed one shard at a
+    time; nothing is ever rebuilt wholesale.
+
+    This worker's ingestion adds its documents directly. ``sync`` follows
+    the document store's index log for the rest (other workers, earlier
+    runs, deletions), reading only entries past the last one applied.
+    """
+
+    def __init__(self):
+        self._shards: Dict[str, CorpusShard] = {}
+        self._term_docs: Dict[str, Set[str]] = {}
+        self._doc_freqs: Dict[str, int] = {}
+        self._num_chunks = 0
+        self._lock = threading.Lock()
+        # Position in the document store's index log; syncs run one at a time
+        self._cursor = 0
+        self._sync_lock = threading.Lock()
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self._shards
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._shards)
+
+    def add(self, doc_id: str, lexical: BM25Index, chunks: ChunkTable) -> None:
+        """Add (or replace) one document's shard."""
+        shard = CorpusShard(lexical, chunks)
+        with self._lock:
+            self._remove_locked(doc_id)
+            self._shards[doc_id] = shard
+            self._num_chunks += shard.num_chunks
+            for term, term_id in shard.vocab.items():
+                self._term_docs.setdefault(term, set()).add(doc_id)
+                self._doc_freqs[term] = self._doc_freqs.get(term, 0) + int(shard.doc_freqs[term_id])
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _remove_locked(self, doc_id: str) -> None:
+        shard = self._shards.pop(doc_id, None)
+        if shard is None:
+            return
+        self._num_chunks -= shard.num_chunks
+        for term, term_id in shard.vocab.items():
+            docs = self._term_docs[term]
+            docs.discard(doc_id)
+            self._doc_freqs[term] -= int(shard.doc_freqs[term_id])
+            if not docs:
+                del self._term_docs[term]
+                del self._doc_freqs[term]
+
+    def sync(self, documents) -> None:
+        """Apply the index log entries recorded since the last sync (blocking)."""
+        with self._sync_lock:
+            cursor, changes = documents.index_changes(self._cursor)
+            for doc_id, indexed in changes:
+                if not indexed:
+                    self.remove(doc_id)
+                    continue
+                if doc_id in self:
+                    continue  # added by this worker's ingestion
+                entry = documents.get(doc_id)
+                if entry and entry.get("index") is not None and entry.get("chunks") is not None:
+                    self.add(doc_id, entry["index"].lexical, entry["chunks"])
+            self._cursor = cursor
+
+    def search(self, query: str, top_k: int = CORPUS_TOP_K) -> List[Dict]:
+        """Return the top_k chunks across all documents, best first, with offset/page/section citations."""
+        with self._lock:
+            n = self._num_chunks
+            term_idf = {}
+            candidates: Set[str] = set()
+            for term in set(tokenize(query)):
+                df = self._doc_freqs.get(term)
+                if df:
+                    term_idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                    candidates |= self._term_docs[term]
+            shards = {doc_id: self._shards[doc_id] for doc_id in candidates}
+
+        bounded = sorted(
+            ((shard.upper_bound(term_idf), doc_id) for doc_id, shard in shards.items()),
+            reverse=True
+        )
+        heap: List = []  # min-heap of (score, doc_id, chunk_id)
+        for bound, doc_id in bounded:
+            if len(heap) >= top_k and bound <= heap[0][0]:
+                break
+            for chunk_id, score in top_k_from_scores(shards[doc_id].scores(term_idf), top_k):
+                item = (score, doc_id, chunk_id)
+                if len(heap) < top_k:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+
+        hits = []
+        for score, doc_id, chunk_id in sorted(heap, reverse=True):
+            hits.append({"doc_id": doc_id, **shards[doc_id].chunks.citation(chunk_id), "score": round(score, 4)})
+        return hits
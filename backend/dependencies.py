@@ -0,0 +1,115 @@
+"""Application components, built on first use and shared by the whole process.
+
+Endpoints receive them through FastAPI ``Depends`` (see the ``provide_*``
+callables), background code calls the ``get_*`` getters directly. Modules
+that are expensive to import are only imported inside the factories, so
+importing the app stays cheap and a worker can accept connections before
+any component exists.
+"""
+import threading
+from typing import Any, Callable, Dict, List
+
+from backend.concurrency import run_blocking
+from backend.document_store import DocumentStore, get_document_store
+from backend.metrics import timed
+
+# Built by warm_up(); /ready reports 503 until all of them exist
+COMPONENTS = ("documents", "processor", "qa_system", "corpus", "ingestion")
+
+_components: Dict[str, Any] = {}
+# Re-entrant: the ingestion factory builds the components it depends on
+_components_lock = threading.RLock()
+
+
+def _component(name: str, factory: Callable[[], Any]) -> Any:
+    component = _components.get(name)
+    if component is None:
+        with _components_lock:
+            component = _components.get(name)
+            if component is None:
+                with timed("startup", name):
+                    component = factory()
+                _components[name] = component
+    return component
+
+
+def get_documents() -> DocumentStore:
+    """Document storage shared by all workers (SQLite by default, see DOCUMENT_STORE)."""
+    return _component("documents", get_document_store)
+
+
+def _build_processor():
+    from backend.document_processor import DocumentProcessor
+    return DocumentProcessor()
+
+
+def get_processor():
+    return _component("processor", _build_processor)
+
+
+def _build_qa_system():
+    from backend.qa_system import QASystem
+    return QASystem()
+
+
+def get_qa_system():
+    return _component("qa_system", _build_qa_system)
+
+
+def _build_corpus():
+    from backend.corpus import CorpusIndex
+    return CorpusIndex()
+
+
+def get_corpus():
+    """Cross-document search; shards are added as documents finish indexing."""
+    return _component("corpus", _build_corpus)
+
+
+def _build_ingestion():
+    from backend.ingestion import IngestionPipeline
+    return IngestionPipeline(get_processor(), get_qa_system(), get_documents(), get_corpus())
+
+
+def get_ingestion():
+    return _component("ingestion", _build_ingestion)
+
+
+def _provider(getter: Callable[[], Any]) -> Callable[[], Any]:
+    # An async dependency runs on the event loop; a plain def would cost a threadpool hop per request
+    async def provide():
+        return getter()
+    provide.__name__ = getter.__name__.replace("get_", "provide_", 1)
+    return provide
+
+
+provide_documents = _provider(get_documents)
+provide_qa_system = _provider(get_qa_system)
+provide_corpus = _provider(get_corpus)
+provide_ingestion = _provider(get_ingestion)
+
+
+def warm_up() -> None:
+    """Build every component (blocking; run it off the event loop)."""
+    from backend.llm_cache import get_llm_cache
+
+    get_ingestion()
+    # Opens the SQLite tier here rather than inside the first LLM call on the event loop
+    get_llm_cache()
+
+
+async def start_components() -> None:
+    """Build every component off the event loop, then start their background work."""
+    await run_blocking(warm_up)
+    await get_ingestion().start()
+
+
+def pending_components() -> List[str]:
+    return [name for name in COMPONENTS if name not in _components]
+
+
+async def shutdown_components() -> None:
+    """Stop components that were actually built; never builds one just to close it."""
+    ingestion = _components.get("ingestion")
+    if ingestion is not None:
+        await ingestion.shutdown()
@@ -0,0 +1,361 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+DOCUMENT_STORE = os.getenv("DOCUMENT_STORE", "sqlite")  # "sqlite" or "memory"
+DOCUMENT_DB_PATH = os.getenv("DOCUMENT_DB_PATH", ".documents.sqlite3")
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "32"))
+
+
+class DocumentStore(ABC):
+    """Storage for uploaded documents and everything derived from them.
+
+    Entries are plain dicts. Callers must write changes back through
+    ``create``/``update``; mutating a dict returned by ``get`` is not persisted.
+
+    A document may be an alias of another one (same content uploaded twice).
+    Reading an alias returns the target's entry overlaid with the alias's own
+    fields (filename, upload time), and updates go to the shared target.
+    """
+
+    # Fields that belong to the alias itself rather than the shared content
+    ALIAS_FIELDS = ("filename", "upload_time")
+
+    @abstractmethod
+    def create(self, doc_id: str, fields: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, doc_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def ids(self) -> Iterator[str]:
+        ...
+
+    def create_alias(self, doc_id: str, target_id: str, fields: Dict[str, Any]) -> None:
+        """Make doc_id share target_id's content, keeping only ALIAS_FIELDS of its own."""
+        own = {k: v for k, v in fields.items() if k in self.ALIAS_FIELDS}
+        self.create(doc_id, {**own, "alias_of": self.resolve(target_id)})
+
+    def resolve(self, doc_id: str) -> str:
+        """Return the doc_id that actually holds the content for doc_id."""
+        entry = self._get_raw(doc_id)
+        if entry is not None and entry.get("alias_of"):
+            return entry["alias_of"]
+        return doc_id
+
+    @abstractmethod
+    def find_content(self, content_key: str) -> Optional[str]:
+        """Return the doc_id registered for a content hash, if any."""
+
+    @abstractmethod
+    def register_content(self, content_key: str, doc_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def record_indexed(self, doc_id: str) -> None:
+        """Log that doc_id's retrieval index is saved, so every worker's corpus index picks it up."""
+
+    @abstractmethod
+    def index_changes(self, cursor: int) -> Tuple[int, List[Tuple[str, bool]]]:
+        """Index log entries after cursor, oldest first, and the cursor to pass next time.
+
+        Each entry is (doc_id, indexed); indexed is False for a deleted document.
+        """
+
+    @abstractmethod
+    def heartbeat(self, owner: str) -> None:
+        """Record that the ingestion worker ``owner`` is alive."""
+
+    @abstractmethod
+    def retire(self, owner: str) -> None:
+        """Forget a worker that is shutting down."""
+
+    @abstractmethod
+    def live_owners(self, max_age: float) -> Set[str]:
+        """Workers that sent a heartbeat within the last max_age seconds."""
+
+    @abstractmethod
+    def unfinished_jobs(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """(doc_id, job_owner, job state) for documents that may still be ingesting.
+
+        That is every non-alias entry whose ``job_owner`` is set; callers
+        check the job state.
+        """
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._get_raw(doc_id)
+        if entry is None or not entry.get("alias_of"):
+            return entry
+        target = self._get_raw(entry["alias_of"])
+        if target is None:
+            return None
+        return {**target, **{k: v for k, v in entry.items() if k in self.ALIAS_FIELDS}}
+
+    def update(self, doc_id: str, **fields: Any) -> None:
+        self._update_raw(self.resolve(doc_id), **fields)
+
+    @abstractmethod
+    def _get_raw(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def _update_raw(self, doc_id: str, **fields: Any) -> None:
+        ...
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self.get(doc_id) is not None
+
+    def __getitem__(self, doc_id: str) -> Dict[str, Any]:
+        entry = self.get(doc_id)
+        if entry is None:
+            raise KeyError(doc_id)
+        return entry
+
+
+class InMemoryDocumentStore(DocumentStore):
+    """Process-local store; fast, but lost on restart and not shared between workers."""
+
+    def __init__(self):
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._content: Dict[str, str] = {}
+        self._owners: Dict[str, float] = {}
+        self._index_log: List[Tuple[str, bool]] = []
+        self._lock = threading.Lock()
+
+    def create(self, doc_id: str, fields: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[doc_id] = dict(fields)
+
+    def _get_raw(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        return self._entries.get(doc_id)
+
+    def _update_raw(self, doc_id: str, **fields: Any) -> None:
+        with self._lock:
+            # Replace rather than mutate: readers may still hold the old dict
+            self._entries[doc_id] = {**self._entries[doc_id], **fields}
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(doc_id, None) is not None:
+                self._index_log.append((doc_id, False))
+
+    def ids(self) -> Iterator[str]:
+        return iter([doc_id for doc_id, entry in list(self._entries.items()) if not entry.get("alias_of")])
+
+    def find_content(self, content_key: str) -> Optional[str]:
+        return self._content.get(content_key)
+
+    def register_content(self, content_key: str, doc_id: str) -> None:
+        with self._lock:
+            self._content[content_key] = doc_id
+
+    def record_indexed(self, doc_id: str) -> None:
+        with self._lock:
+            self._index_log.append((doc_id, True))
+
+    def index_changes(self, cursor: int) -> Tuple[int, List[Tuple[str, bool]]]:
+        with self._lock:
+            return len(self._index_log), self._index_log[cursor:]
+
+    def heartbeat(self, owner: str) -> None:
+        self._owners[owner] = time.time()
+
+    def retire(self, owner: str) -> None:
+        self._owners.pop(owner, None)
+
+    def live_owners(self, max_age: float) -> Set[str]:
+        cutoff = time.time() - max_age
+        return {owner for owner, seen in list(self._owners.items()) if seen >= cutoff}
+
+    def unfinished_jobs(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        return [
+            (doc_id, entry["job_owner"], entry["job"])
+            for doc_id, entry in list(self._entries.items())
+            if not entry.get("alias_of") and entry.get("job_owner") is not None
+        ]
+
+
+class SQLiteDocumentStore(DocumentStore):
+    """SQLite-backed store shared by every worker process, with a hot LRU of decoded entries.
+
+    Large fields get their own columns (text as TEXT, chunks and indexes
+    pickled) so that small updates such as a new summary only rewrite the
+    JSON metadata. Each write bumps a version number; a cached entry is
+    reused only while its version matches the row, so workers see each
+    other's updates.
+    """
+
+    # field name -> (column, encode, decode)
+    _COLUMNS = {
+        "text": ("text", lambda v: v, lambda v: v),
+        "chunks": ("chunks", pickle.dumps, pickle.loads),
+        "index": ("index_blob", pickle.dumps, pickle.loads),
+    }
+
+    def __init__(self, path: str = DOCUMENT_DB_PATH, cache_size: int = DOCUMENT_CACHE_SIZE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "doc_id TEXT PRIMARY KEY, version INTEGER NOT NULL, meta TEXT NOT NULL, "
+            "text TEXT, chunks BLOB, index_blob BLOB)"
+        )
+        # Append-only feed of indexed and deleted documents, read incrementally by every corpus index
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS index_log ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, doc_id TEXT NOT NULL, indexed INTEGER NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS content_keys (content_key TEXT PRIMARY KEY, doc_id TEXT NOT NULL)")
+        # Ingestion workers check in here, so any of them can tell a dead worker's jobs from live ones
+        self._db.execute("CREATE TABLE IF NOT EXISTS workers (owner TEXT PRIMARY KEY, seen REAL NOT NULL)")
+        self._lock = threading.Lock()
+        self._cache_size = cache_size
+        self._hot: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+
+    def _split(self, fields: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        columns, meta = {}, {}
+        for name, value in fields.items():
+            if name in self._COLUMNS:
+                column, encode, _ = self._COLUMNS[name]
+                columns[column] = encode(value) if value is not None else None
+            else:
+                meta[name] = value
+        return columns, meta
+
+    def create(self, doc_id: str, fields: Dict[str, Any]) -> None:
+        columns, meta = self._split(fields)
+        names = ["doc_id", "version", "meta"] + list(columns)
+        values = [doc_id, 1, json.dumps(meta)] + list(columns.values())
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO documents ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                values
+            )
+            self._hot.pop(doc_id, None)
+
+    def _get_raw(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT version FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                self._hot.pop(doc_id, None)
+                return None
+            cached = self._hot.get(doc_id)
+            if cached is not None and cached[0] == row[0]:
+                self._hot.move_to_end(doc_id)
+                return cached[1]
+
+            row = self._db.execute(
+                "SELECT version, meta, text, chunks, index_blob FROM documents WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            version, meta, text, chunks, index_blob = row
+            entry = json.loads(meta)
+            for name, raw in (("text", text), ("chunks", chunks), ("index", index_blob)):
+                entry[name] = self._COLUMNS[name][2](raw) if raw is not None else None
+
+            self._hot[doc_id] = (version, entry)
+            self._hot.move_to_end(doc_id)
+            while len(self._hot) > self._cache_size:
+                self._hot.popitem(last=False)
+            return entry
+
+    def _update_raw(self, doc_id: str, **fields: Any) -> None:
+        columns, meta = self._split(fields)
+        with self._lock:
+            row = self._db.execute("SELECT meta FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+            if row is None:
+                raise KeyError(doc_id)
+            merged = json.loads(row[0])
+            merged.update(meta)
+            assignments = ["version = version + 1", "meta = ?"] + [f"{column} = ?" for column in columns]
+            version = self._db.execute(
+                f"UPDATE documents SET {', '.join(assignments)} WHERE doc_id = ? RETURNING version",
+                [json.dumps(merged)] + list(columns.values()) + [doc_id]
+            ).fetchone()[0]
+            # Swap in an updated copy rather than re-decoding large fields; readers
+            # may still hold the old dict, so it is never modified. A copy that
+            # missed another worker's write is dropped instead.
+            cached = self._hot.pop(doc_id, None)
+            if cached is not None and cached[0] == version - 1:
+                self._hot[doc_id] = (version, {**cached[1], **fields})
+
+    def delete(self, doc_id: str) -> None:
+        with self._lock:
+            if self._db.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount:
+                self._db.execute("INSERT INTO index_log (doc_id, indexed) VALUES (?, 0)", (doc_id,))
+            self._hot.pop(doc_id, None)
+
+    def ids(self) -> Iterator[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT doc_id FROM documents WHERE json_extract(meta, '$.alias_of') IS NULL"
+            ).fetchall()
+        return iter([row[0] for row in rows])
+
+    def find_content(self, content_key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT doc_id FROM content_keys WHERE content_key = ?", (content_key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def register_content(self, content_key: str, doc_id: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO content_keys (content_key, doc_id) VALUES (?, ?)", (content_key, doc_id)
+            )
+
+    def record_indexed(self, doc_id: str) -> None:
+        with self._lock:
+            self._db.execute("INSERT INTO index_log (doc_id, indexed) VALUES (?, 1)", (doc_id,))
+
+    def index_changes(self, cursor: int) -> Tuple[int, List[Tuple[str, bool]]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, doc_id, indexed FROM index_log WHERE seq > ? ORDER BY seq", (cursor,)
+            ).fetchall()
+        return (rows[-1][0] if rows else cursor), [(doc_id, bool(indexed)) for _, doc_id, indexed in rows]
+
+    def heartbeat(self, owner: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO workers (owner, seen) VALUES (?, ?)", (owner, now))
+            # Workers gone for a day will never come back (owner ids are unique per process)
+            self._db.execute("DELETE FROM workers WHERE seen < ?", (now - 86400,))
+
+    def retire(self, owner: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM workers WHERE owner = ?", (owner,))
+
+    def live_owners(self, max_age: float) -> Set[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT owner FROM workers WHERE seen >= ?", (time.time() - max_age,)).fetchall()
+        return {row[0] for row in rows}
+
+    def unfinished_jobs(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT doc_id, json_extract(meta, '$.job_owner'), json_extract(meta, '$.job') FROM documents "
+                "WHERE json_extract(meta, '$.alias_of') IS NULL AND json_extract(meta, '$.job_owner') IS NOT NULL"
+            ).fetchall()
+        return [(doc_id, owner, json.loads(job)) for doc_id, owner, job in rows]
+
+
+def get_document_store() -> DocumentStore:
+    """Build the store selected by DOCUMENT_STORE."""
+    if DOCUMENT_STORE == "memory":
+        return InMemoryDocumentStore()
+    return SQLiteDocumentStore()
@@ -0,0 +1,347 @@
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Dict, Optional, Set
+
+from fastapi import HTTPException
+
+from backend.chunking import build_chunk_table
+from backend.concurrency import run_blocking
+from backend.document_store import DocumentStore
+from backend.metrics import STAGE_SECONDS
+from backend.summarizer import extractive_summary
+from backend.uploads import discard
+
+STAGES = ("extract", "summarize", "chunk", "index", "refine")
+# A failed LLM refinement leaves the extractive summary in place, so it doesn't fail the job
+OPTIONAL_STAGES = ("refine",)
+# Seconds /upload/ waits for the extractive summary before answering without one
+UPLOAD_SUMMARY_WAIT = float(os.getenv("UPLOAD_SUMMARY_WAIT", "2"))
+# Seconds between worker heartbeats; a worker silent for three of them is presumed dead
+INGESTION_HEARTBEAT = float(os.getenv("INGESTION_HEARTBEAT", "10"))
+ORPHAN_AFTER = 3 * INGESTION_HEARTBEAT
+
+INTERRUPTED = "Processing was interrupted (the server restarted or its worker died); upload the document again"
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(kind: str, data: bytes) -> str:
+    """Hash raw upload bytes ("raw") or normalised text ("text") into a dedup key."""
+    return digest_key(kind, hashlib.sha256(data).hexdigest())
+
+
+def digest_key(kind: str, sha256: str) -> str:
+    """Dedup key from a SHA-256 hex digest computed elsewhere (e.g. while spooling an upload)."""
+    return f"{kind}:{sha256}"
+
+
+class IngestionJob:
+    """Progress of one document through the ingestion stages."""
+
+    def __init__(self, doc_id: str):
+        self.job_id = str(uuid.uuid4())
+        self.doc_id = doc_id
+        self.created_at = time.time()
+        self.stages: Dict[str, Dict] = {
+            name: {"status": "pending", "started_at": None, "finished_at": None, "error": None}
+            for name in STAGES
+        }
+
+    def to_state(self) -> Dict:
+        """JSON-serialisable state stored with the document entry."""
+        return {"job_id": self.job_id, "doc_id": self.doc_id, "created_at": self.created_at, "stages": self.stages}
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "IngestionJob":
+        job = cls.__new__(cls)
+        job.job_id = state["job_id"]
+        job.doc_id = state["doc_id"]
+        job.created_at = state["created_at"]
+        job.stages = state["stages"]
+        return job
+
+    def start(self, stage: str) -> None:
+        self.stages[stage].update(status="running", started_at=time.time())
+
+    def finish(self, stage: str) -> None:
+        self.stages[stage].update(status="done", finished_at=time.time())
+        STAGE_SECONDS.observe(
+            self.stages[stage]["finished_at"] - self.stages[stage]["started_at"], component="ingestion", stage=stage
+        )
+
+    def fail(self, stage: str, error: str) -> None:
+        self.stages[stage].update(status="failed", finished_at=time.time(), error=error)
+
+    def abandon(self, error: str) -> None:
+        """Fail the stage that was running (or due to run next) when the job's worker went away."""
+        for name, stage in self.stages.items():
+            if stage["status"] == "running":
+                self.fail(name, error)
+                return
+        for name, stage in self.stages.items():
+            if stage["status"] == "pending":
+                self.fail(name, error)
+                return
+
+    def is_done(self, stage: str) -> bool:
+        return self.stages[stage]["status"] == "done"
+
+    @property
+    def status(self) -> str:
+        states = [stage["status"] for name, stage in self.stages.items() if name not in OPTIONAL_STAGES]
+        optional = [stage["status"] for name, stage in self.stages.items() if name in OPTIONAL_STAGES]
+        if "failed" in states:
+            return "failed"
+        if all(state == "done" for state in states) and all(state in ("done", "failed") for state in optional):
+            return "completed"
+        if all(state == "pending" for state in states):
+            return "queued"
+        return "running"
+
+    def to_dict(self) -> Dict:
+        stages = {}
+        for name, stage in self.stages.items():
+            duration = None
+            if stage["started_at"] and stage["finished_at"]:
+                duration = round(stage["finished_at"] - stage["started_at"], 3)
+            stages[name] = {"status": stage["status"], "duration": duration, "error": stage["error"]}
+        return {"job_id": self.job_id, "status": self.status, "stages": stages}
+
+
+class IngestionPipeline:
+    """Runs extraction, summarisation, chunking, indexing and LLM refinement as background stages.
+
+    The document entry is created immediately with ``text`` set to None and is
+    filled in stage by stage, so questions can be answered as soon as the text
+    is extracted. The first summary is a local extractive one; the LLM summary
+    replaces it in the last stage (``summary_kind`` tells them apart).
+
+    Unfinished entries carry the ``job_owner`` of the worker running them,
+    and workers send heartbeats through the store. ``start`` runs a monitor
+    that marks jobs failed when their worker stopped (restart, crash or a
+    dead peer process), so they never report "running" forever.
+    """
+
+    def __init__(self, processor, qa_system, documents: DocumentStore, corpus=None):
+        self.processor = processor
+        self.qa_system = qa_system
+        self.documents = documents
+        self.corpus = corpus
+        # Hold strong references so running tasks aren't garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+        # Set once a job has its first summary (or has stopped before getting one)
+        self._summary_ready: Dict[str, asyncio.Event] = {}
+        # Unique per process, so a restarted worker never looks like its predecessor
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Documents with a live task in this process
+        self._running: Set[str] = set()
+        self._monitor: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        """Check in, fail jobs orphaned by dead workers, and keep doing both in the background."""
+        if self._monitor is not None:
+            return
+        await run_blocking(self.documents.heartbeat, self.owner)
+        self._monitor = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            try:
+                await run_blocking(self.documents.heartbeat, self.owner)
+                await run_blocking(self.recover_orphans)
+                if self.corpus is not None:
+                    # Load documents indexed by other workers before a search needs them
+                    await run_blocking(self.corpus.sync, self.documents)
+            except Exception:
+                logger.exception("Ingestion monitor failed")
+            await asyncio.sleep(INGESTION_HEARTBEAT)
+
+    def recover_orphans(self) -> int:
+        """Mark unfinished jobs that no live task owns as failed; returns how many (blocking)."""
+        live = self.documents.live_owners(ORPHAN_AFTER) | {self.owner}
+        recovered = 0
+        for doc_id, owner, state in self.documents.unfinished_jobs():
+            job = IngestionJob.from_state(state)
+            if job.status not in ("completed", "failed"):
+                if owner == self.owner and doc_id in self._running:
+                    continue
+                if owner != self.owner and owner in live:
+                    continue
+                job.abandon(INTERRUPTED)
+                recovered += 1
+                logger.warning("Ingestion of %s was orphaned by worker %s; marked failed", doc_id, owner)
+            self.documents.update(doc_id, job=job.to_state(), job_owner=None)
+        return recovered
+
+    def find_duplicate(self, key: str) -> Optional[str]:
+        """Return the document already holding this content, if it is complete or still being ingested.
+
+        A failed document, or one whose ingestion no live task owns any more,
+        is not reused: the caller ingests the content again and its
+        ``register_content`` replaces the stale mapping.
+        """
+        doc_id = self.documents.find_content(key)
+        if doc_id is None:
+            return None
+        entry = self.documents.get(doc_id)
+        if entry is None:
+            return None
+        status = IngestionJob.from_state(entry["job"]).status
+        if status == "completed" or (status != "failed" and self._is_live(doc_id, entry.get("job_owner"))):
+            return doc_id
+        return None
+
+    def _is_live(self, doc_id: str, owner: Optional[str]) -> bool:
+        """Whether a running task is still ingesting doc_id, here or in another worker."""
+        if owner == self.owner:
+            return doc_id in self._running
+        return owner is not None and owner in self.documents.live_owners(ORPHAN_AFTER)
+
+    async def submit(self, doc_id: str, filename: str, path: str, is_pdf: bool, upload_time: str,
+                     raw_key: Optional[str] = None) -> IngestionJob:
+        """Start ingesting the spooled upload at path; the pipeline removes the file when done with it."""
+        job = IngestionJob(doc_id)
+        self._running.add(doc_id)
+        try:
+            await run_blocking(self._create_entry, job, filename, upload_time, raw_key)
+        except BaseException:
+            self._running.discard(doc_id)
+            raise
+        self._summary_ready[job.job_id] = asyncio.Event()
+        task = asyncio.create_task(self._run(job, path, is_pdf))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _create_entry(self, job: IngestionJob, filename: str, upload_time: str, raw_key: Optional[str]) -> None:
+        if self._monitor is None:
+            # An upload can beat startup; check in before other workers could judge our jobs
+            self.documents.heartbeat(self.owner)
+        self.documents.create(job.doc_id, {
+            "text": None,
+            "chunks": None,
+            "index": None,
+            "summary": None,
+            "summary_kind": None,
+            "page_offsets": [],
+            "failed_pages": [],
+            "filename": filename,
+            "upload_time": upload_time,
+            "job": job.to_state(),
+            "job_owner": self.owner,
+        })
+        if raw_key:
+            # Registered up front so concurrent duplicates alias onto this job
+            self.documents.register_content(raw_key, job.doc_id)
+
+    async def wait_for_summary(self, job: IngestionJob, timeout: float = UPLOAD_SUMMARY_WAIT) -> None:
+        """Wait up to timeout seconds for the job's first summary."""
+        ready = self._summary_ready.get(job.job_id)
+        if ready is None:
+            return
+        try:
+            await asyncio.wait_for(ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _save(self, job: IngestionJob, **fields) -> None:
+        # Large fields make this a real write, so keep it off the event loop
+        await run_blocking(self.documents.update, job.doc_id, job=job.to_state(), **fields)
+
+    async def _run(self, job: IngestionJob, path: str, is_pdf: bool) -> None:
+        try:
+            await self._ingest(job, path, is_pdf)
+        finally:
+            discard(path)
+            self._running.discard(job.doc_id)
+            self._summary_ready.pop(job.job_id).set()
+
+    async def _ingest(self, job: IngestionJob, path: str, is_pdf: bool) -> None:
+        stage = "extract"
+        try:
+            job.start(stage)
+            await self._save(job)
+            # Parsing is CPU-bound, so keep it off the event loop
+            fields = {}
+            if is_pdf:
+                # Parsed from a memory map of the file, never a bytes copy
+                extraction = await run_blocking(self.processor.extract_pdf, path)
+                fields = {"page_offsets": extraction.page_offsets, "failed_pages": extraction.failed_pages}
+                text = extraction.text
+            else:
+                text = await run_blocking(self.processor.process_text_file, path)
+            discard(path)
+            job.finish(stage)
+
+            # Different bytes can still carry the same text (re-exported PDFs, line endings)
+            text_key = content_key("text", text.encode("utf-8"))
+            duplicate_id = await run_blocking(self.find_duplicate, text_key)
+            if duplicate_id is not None and duplicate_id != job.doc_id:
+                entry = await run_blocking(self.documents.get, job.doc_id)
+                await run_blocking(self.documents.create_alias, job.doc_id, duplicate_id, entry)
+                return
+            await run_blocking(self.documents.register_content, text_key, job.doc_id)
+
+            # Questions can be answered from here on, first-chunk context until indexed
+            await self._save(job, text=text, **fields)
+
+            stage = "summarize"
+            job.start(stage)
+            # Local and CPU-only: available in milliseconds, whatever state the LLM is in
+            summary = await run_blocking(extractive_summary, text)
+            job.finish(stage)
+            await self._save(job, summary=summary or None, summary_kind="extractive" if summary else None)
+            self._summary_ready[job.job_id].set()
+
+            stage = "chunk"
+            job.start(stage)
+            # One boundary-aware pass; every later consumer takes views from this table
+            chunks = await run_blocking(build_chunk_table, text, fields.get("page_offsets"))
+            job.finish(stage)
+            await self._save(job, chunks=chunks)
+
+            stage = "index"
+            job.start(stage)
+            # Build the retrieval index once so questions don't rescan the text
+            index = await run_blocking(self.qa_system.build_index, chunks.texts(text), job.doc_id)
+            job.finish(stage)
+            await self._save(job, index=index)
+            await run_blocking(self.documents.record_indexed, job.doc_id)
+            if self.corpus is not None:
+                # Incremental: only this document's shard is built
+                await run_blocking(self.corpus.add, job.doc_id, index.lexical, chunks)
+
+            stage = "refine"
+            job.start(stage)
+            await self._save(job)
+            # Per-chunk map results are kept so other summary lengths skip the map phase
+            summary_map = {}
+            summary = await self.qa_system.agenerate_summary(text, chunks, summary_map)
+            job.finish(stage)
+            await self._save(job, summary=summary, summary_kind="abstractive", summary_map=summary_map,
+                             job_owner=None)
+        except HTTPException as e:
+            job.fail(stage, str(e.detail))
+            await self._save(job, job_owner=None)
+        except UnicodeDecodeError:
+            job.fail(stage, "Text file contains invalid characters (not UTF-8 encoded)")
+            await self._save(job, job_owner=None)
+        except Exception as e:
+            job.fail(stage, str(e))
+            await self._save(job, job_owner=None)
+
+    async def shutdown(self) -> None:
+        if self._monitor is not None:
+            self._monitor.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        # The cancelled jobs are ours and dead now: record that instead of waiting for a peer to notice
+        await run_blocking(self.recover_orphans)
+        await run_blocking(self.documents.retire, self.owner)
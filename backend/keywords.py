@@ -0,0 +1,126 @@
+import re
+from bisect import bisect_right
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Tuple
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+")
+
+
+class KeywordHit(NamedTuple):
+    start: int
+    end: int
+    keyword: str
+
+
+class SentenceMatch(NamedTuple):
+    start: int
+    end: int
+    hits: List[KeywordHit]
+
+
+def sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets of the sentences of text, breaking after . ! or ? and whitespace."""
+    spans, start = [], 0
+    for gap in _SENTENCE_BREAK.finditer(text):
+        spans.append((start, gap.start()))
+        start = gap.end()
+    if start < len(text):
+        spans.append((start, len(text)))
+    return spans
+
+
+def _fold(text: str) -> str:
+    """Lowercase without changing offsets (a few characters lowercase to two)."""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return "".join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+class KeywordMatcher:
+    """Case-insensitive Aho-Corasick automaton over a fixed set of keywords.
+
+    Failure links are folded into a full transition table at compile time,
+    so ``finditer`` is one dictionary lookup per character of text whatever
+    the number of keywords. Every occurrence is reported, including
+    overlapping ones. With ``whole_words`` a hit must not be preceded or
+    followed by a letter or digit.
+    """
+
+    def __init__(self, keywords: Iterable[str], whole_words: bool = False):
+        self.keywords = sorted({keyword.strip() for keyword in keywords if keyword.strip()})
+        self.whole_words = whole_words
+        # State 0 is the root; outputs hold the indices of keywords ending in a state
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._outputs: List[List[int]] = [[]]
+        for index, keyword in enumerate(self.keywords):
+            self._add(_fold(keyword), index)
+        self._link()
+        self._lengths = [len(_fold(keyword)) for keyword in self.keywords]
+
+    def _add(self, keyword: str, index: int) -> None:
+        state = 0
+        for char in keyword:
+            following = self._goto[state].get(char)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][char] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+            state = following
+        self._outputs[state].append(index)
+
+    def _link(self) -> None:
+        # Breadth first, so a state's failure target (a shorter suffix) is complete before the state
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            children = dict(self._goto[state])
+            if state:
+                # Characters with no edge of their own go where the failure state goes
+                self._goto[state] = {**self._goto[self._fail[state]], **children}
+            for char, following in children.items():
+                queue.append(following)
+                target = self._goto[self._fail[state]].get(char, 0) if state else 0
+                self._fail[following] = target
+                self._outputs[following] = self._outputs[following] + self._outputs[target]
+
+    def finditer(self, text: str) -> Iterator[KeywordHit]:
+        """Every keyword occurrence in text, ordered by end offset."""
+        goto, outputs = self._goto, self._outputs
+        state = 0
+        for position, char in enumerate(_fold(text)):
+            state = goto[state].get(char, 0)
+            if not outputs[state]:
+                continue
+            for index in outputs[state]:
+                start = position + 1 - self._lengths[index]
+                if self.whole_words and not _at_word_boundaries(text, start, position + 1):
+                    continue
+                yield KeywordHit(start, position + 1, self.keywords[index])
+
+    def match_sentences(self, text: str) -> List[SentenceMatch]:
+        """Sentences containing at least one keyword, in document order, with their hits."""
+        spans = sentence_spans(text)
+        starts = [start for start, _ in spans]
+        matches: Dict[int, List[KeywordHit]] = {}
+        for hit in self.finditer(text):
+            sentence = bisect_right(starts, hit.start) - 1
+            matches.setdefault(sentence, []).append(hit)
+        return [
+            SentenceMatch(spans[sentence][0], spans[sentence][1], sorted(hits))
+            for sentence, hits in sorted(matches.items())
+        ]
+
+
+def _at_word_boundaries(text: str, start: int, end: int) -> bool:
+    return (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum())
+
+
+@lru_cache(maxsize=128)
+def get_matcher(keywords: Tuple[str, ...], whole_words: bool = False) -> KeywordMatcher:
+    """Compiled matcher for a keyword set, reused across requests."""
+    return KeywordMatcher(keywords, whole_words)
@@ -0,0 +1,182 @@
+import contextvars
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from backend.concurrency import run_blocking
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512"))
+LLM_CACHE_DISK_ENTRIES = int(os.getenv("LLM_CACHE_DISK_ENTRIES", "20000"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+
+# Per-request switch: when set, lookups are skipped but fresh results are still stored
+_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+def set_cache_bypass(bypass: bool) -> contextvars.Token:
+    """Enable or disable cache reads for the current request context."""
+    return _bypass.set(bypass)
+
+
+def reset_cache_bypass(token: contextvars.Token) -> None:
+    _bypass.reset(token)
+
+
+def cache_bypassed() -> bool:
+    """Whether cache reads are skipped in the current context (part of coalescing keys)."""
+    return _bypass.get()
+
+
+class LLMCache:
+    """Content-addressed completion cache: in-memory LRU in front of a SQLite file.
+
+    ``get``/``set`` may touch SQLite and block. From async code use
+    ``aget``/``aset``: the memory tier is checked on the event loop and only
+    the SQLite reads and writes go to the executor.
+    """
+
+    def __init__(self, path: Optional[str] = LLM_CACHE_PATH, memory_entries: int = LLM_CACHE_MEMORY_ENTRIES,
+                 disk_entries: int = LLM_CACHE_DISK_ENTRIES, ttl: float = LLM_CACHE_TTL):
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self.ttl = ttl
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        # Guards the memory tier and stats; the SQLite connection has its own lock,
+        # so a slow disk access never holds up a memory lookup on the event loop
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "writes": 0}
+
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache(created_at)")
+
+    @staticmethod
+    def make_key(model: str, prompt: str, params: Optional[Dict[str, Any]] = None) -> str:
+        """Hash (model, prompt, parameters) into a stable cache key."""
+        payload = json.dumps([model, prompt, params or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached completion for key, or None on miss/expiry/bypass."""
+        done, value = self._get_memory(key)
+        return value if done else self._get_disk(key)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """get without blocking the event loop."""
+        done, value = self._get_memory(key)
+        return value if done else await run_blocking(self._get_disk, key)
+
+    def set(self, key: str, value: str) -> None:
+        """Store a completion in both tiers."""
+        self._write_disk(key, value, *self._set_memory(key, value))
+
+    async def aset(self, key: str, value: str) -> None:
+        """set without blocking the event loop."""
+        await run_blocking(self._write_disk, key, value, *self._set_memory(key, value))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_cache")
+
+    def _get_memory(self, key: str) -> Tuple[bool, Optional[str]]:
+        """(True, answer) when the memory tier settles the lookup, (False, None) to try SQLite."""
+        with self._lock:
+            if _bypass.get():
+                self.stats["bypassed"] += 1
+                return True, None
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.time():
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return True, value
+                del self._memory[key]
+            if self._db is None:
+                self.stats["misses"] += 1
+                return True, None
+        return False, None
+
+    def _get_disk(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._db.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is not None and row[1] > time.time():
+                self._remember(key, row[0], row[1])
+                self.stats["disk_hits"] += 1
+                return row[0]
+            self.stats["misses"] += 1
+            return None
+
+    def _set_memory(self, key: str, value: str) -> Tuple[float, float]:
+        now = time.time()
+        expires_at = now + self.ttl
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self.stats["writes"] += 1
+        return expires_at, now
+
+    def _write_disk(self, key: str, value: str, expires_at: float, now: float) -> None:
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= 100:
+                self._prune(now)
+
+    def _remember(self, key: str, value: str, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _prune(self, now: float) -> None:
+        """Drop expired rows and keep the file under disk_entries (oldest first)."""
+        self._writes_since_prune = 0
+        self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.disk_entries,)
+        )
+
+
+_cache: Optional[LLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """Return the process-wide cache, or None when LLM_CACHE_ENABLED=0."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMCache()
+    return _cache
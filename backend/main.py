@@ -1,15 +1,42 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from fastapi import status
 from fastapi import Query
-from backend.document_processor import DocumentProcessor
-from backend.qa_system import QASystem
+from backend.qa_system import QAStreamParser
+from backend.retrieval import RETRIEVAL_MODES
+from backend.corpus import CORPUS_TOP_K
+from backend.openrouter_llm import aclose_transport
+from backend.concurrency import run_blocking, shutdown_executor
+from backend.ingestion import IngestionJob, digest_key
+from backend.document_store import DocumentStore
+from backend.dependencies import (
+    pending_components, provide_corpus, provide_documents, provide_ingestion, provide_qa_system,
+    shutdown_components, start_components
+)
+from backend.keywords import get_matcher
+from backend.uploads import UploadSizeLimit, discard, spool_upload
+from backend.pdf_extraction import shutdown_pool
+from backend.resilience import LLMUnavailableError
+from backend.singleflight import SingleFlight, normalize_text
+from backend.llm_cache import cache_bypassed, get_llm_cache, set_cache_bypass, reset_cache_bypass
+from backend.metrics import (
+    HTTP_INFLIGHT, HTTP_SECONDS, REGISTRY, SERVER_TIMING, CallbackMetric,
+    finish_request_timing, format_server_timing, start_request_timing
+)
 from pydantic import BaseModel
+import asyncio
+import json
+import logging
+import time
 import uuid
+from typing import List, Optional, Tuple
 from datetime import datetime  # Import for datetime
 from fastapi import HTTPException
 from pydantic import BaseModel
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 # Configure CORS
@@ -20,13 +47,94 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Oversized uploads get a 413 while their bytes arrive, before anything is spooled in full
+app.add_middleware(UploadSizeLimit, paths=["/upload/"])
+
+# Components (document store, LLM clients, indexes, ingestion) are built on
+# first use by backend.dependencies and warmed up in the background at startup
+_warm_up_task: Optional[asyncio.Task] = None
+
+# Concurrent identical requests (same document content, operation and
+# normalised input) await one computation instead of each calling the LLM
+coalesced = SingleFlight("api")
+
+
+def llm_cache_samples():
+    cache = get_llm_cache()
+    return [({"result": name}, value) for name, value in cache.stats.items()] if cache else []
+
+
+REGISTRY.register(CallbackMetric(
+    "research_assistant_llm_cache_events_total",
+    "LLM cache lookups by result (memory_hits, disk_hits, misses, bypassed) and writes.",
+    "counter",
+    llm_cache_samples
+))
+
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    token = start_request_timing()
+    HTTP_INFLIGHT.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        # Streaming responses are timed until their headers are sent
+        elapsed = time.perf_counter() - start
+        HTTP_INFLIGHT.dec()
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(
+            elapsed, method=request.method, route=getattr(route, "path", "unmatched"), status=status_code
+        )
+        timings = finish_request_timing(token)
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = format_server_timing(timings, elapsed)
+    return response
+
+
+@app.middleware("http")
+async def llm_cache_bypass(request: Request, call_next):
+    # "Cache-Control: no-cache" or ?no_cache=true forces fresh LLM calls for this request
+    bypass = (
+        "no-cache" in request.headers.get("cache-control", "").lower()
+        or request.query_params.get("no_cache", "").lower() in ("1", "true")
+    )
+    token = set_cache_bypass(bypass)
+    try:
+        return await call_next(request)
+    finally:
+        reset_cache_bypass(token)
+
+
+@app.exception_handler(LLMUnavailableError)
+async def llm_unavailable(request: Request, exc: LLMUnavailableError):
+    # Upstream outage or deadline: tell clients to come back rather than reporting a server bug
+    headers = {"Retry-After": str(max(1, round(exc.retry_after or 1)))}
+    return JSONResponse(status_code=503, content={"detail": f"LLM unavailable: {exc}"}, headers=headers)
 
-# Initialize components
-processor = DocumentProcessor()
-qa_system = QASystem()
 
-# Temporary storage for documents
-documents = {}
+@app.on_event("startup")
+async def start_warm_up():
+    global _warm_up_task
+    # Serve immediately; /ready turns 200 once the components exist
+    _warm_up_task = asyncio.create_task(start_components())
+    _warm_up_task.add_done_callback(log_warm_up_failure)
+
+
+def log_warm_up_failure(task: asyncio.Task) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Component warm-up failed", exc_info=task.exception())
+
+
+@app.on_event("shutdown")
+async def close_llm_transport():
+    await shutdown_components()
+    await aclose_transport()
+    shutdown_executor()
+    shutdown_pool()
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
@@ -43,7 +151,16 @@ async def read_root():
                 <li><a href="/redoc">/redoc</a> - Alternative documentation</li>
                 <li>/upload - POST endpoint for document upload</li>
                 <li>/ask/{doc_id} - POST endpoint for questions</li>
+                <li>/ask_batch/{doc_id} - POST endpoint answering a list of questions at once</li>
+                <li>/ask_stream/{doc_id} - POST endpoint streaming the answer as Server-Sent Events</li>
                 <li>/challenge/{doc_id} - GET endpoint for challenges</li>
+                <li>/search - GET endpoint for passages across all documents</li>
+                <li>/highlight/{doc_id} - GET endpoint for keyword matches to highlight</li>
+                <li>/ask_corpus - POST endpoint for questions across all documents</li>
+                <li>/metrics - GET endpoint for Prometheus metrics</li>
+                <li>/ready - GET readiness probe (503 until components are built)</li>
+                <li>/status/{doc_id} - GET endpoint for ingestion progress</li>
+                <li>/summary/{doc_id} - GET endpoint for summaries of a chosen length</li>
             </ul>
             <p>Frontend should be running at <a href="http://localhost:8501">http://localhost:8501</a></p>
         </body>
@@ -52,8 +169,20 @@ async def read_root():
 
 
 
-@app.post("/upload/")
-async def upload_document(file: UploadFile = File(...)):
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until every component is built, then 200."""
+    pending = pending_components()
+    if pending:
+        return JSONResponse(status_code=503, content={"status": "starting", "pending": pending})
+    return {"status": "ready"}
+
+
+@app.post("/upload/", status_code=status.HTTP_202_ACCEPTED)
+async def upload_document(response: Response, file: UploadFile = File(...),
+                          documents: DocumentStore = Depends(provide_documents),
+                          ingestion=Depends(provide_ingestion)):
+    upload = None
     try:
         # Get clean lowercase extension
         filename = file.filename
@@ -80,74 +209,352 @@ async def upload_document(file: UploadFile = File(...)):
                     detail="Invalid PDF file (missing PDF header)"
                 )
         
-        # Read file content
-        contents = await file.read()
+        # Copy to our own temp file in fixed-size chunks (hashing as we go): the
+        # request's spool is gone once we respond, and ingestion reads from disk
+        upload = await run_blocking(spool_upload, file.file)
         
         # Generate unique document ID
         doc_id = str(uuid.uuid4())
+        upload_time = datetime.now().isoformat()
         
-        # Process the file based on type
-        if is_pdf:
-            text = processor.process_pdf(contents)
-        else:
-            text = processor.process_text(contents)
-        
-        # Store document
-        documents[doc_id] = {
-            "text": text,
-            "filename": filename,
-            "upload_time": datetime.now().isoformat()
-        }
+        # Identical bytes were already processed: alias the existing artifacts
+        raw_key = digest_key("raw", upload.sha256)
+        duplicate_id = await run_blocking(ingestion.find_duplicate, raw_key)
+        if duplicate_id is not None:
+            discard(upload.path)
+            await run_blocking(documents.create_alias, doc_id, duplicate_id,
+                               {"filename": filename, "upload_time": upload_time})
+            entry = await run_blocking(documents.get, doc_id)
+            job = IngestionJob.from_state(entry["job"])
+            if entry["summary"]:
+                response.status_code = status.HTTP_200_OK
+            return {
+                "status": "success" if entry["summary"] else "processing",
+                "doc_id": doc_id,
+                "job_id": job.job_id,
+                "filename": filename,
+                "summary": entry["summary"],
+                "summary_kind": entry.get("summary_kind"),
+                "status_url": f"/status/{doc_id}",
+                "duplicate_of": duplicate_id,
+                "message": "Duplicate of an existing document; sharing its processed data"
+            }
         
-        # Generate initial summary
-        summary = qa_system.generate_summary(text)
+        # Extraction, indexing and summarisation continue in the background
+        job = await ingestion.submit(doc_id, filename, upload.path, is_pdf, upload_time, raw_key)
+        # The pipeline owns the file from here on
+        upload = None
+        # The local extractive summary is usually ready within milliseconds of extraction
+        await ingestion.wait_for_summary(job)
+        entry = await run_blocking(documents.get, doc_id)
         
         return {
-            "status": "success",
+            "status": "processing",
             "doc_id": doc_id,
+            "job_id": job.job_id,
             "filename": filename,
-            "summary": summary,
-            "message": "Document processed successfully"
+            "summary": entry["summary"],
+            "summary_kind": entry.get("summary_kind"),
+            "status_url": f"/status/{doc_id}",
+            "message": "Document accepted for processing"
         }
         
     except HTTPException:
         raise
-    except UnicodeDecodeError:
-        raise HTTPException(
-            status_code=400,
-            detail="Text file contains invalid characters (not UTF-8 encoded)"
-        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if upload is not None:
+            discard(upload.path)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of this worker's counters and histograms."""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/status/{doc_id}")
+async def document_status(doc_id: str, documents: DocumentStore = Depends(provide_documents)):
+    entry = await run_blocking(documents.get, doc_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    job = IngestionJob.from_state(entry["job"])
+    return {
+        "doc_id": doc_id,
+        "filename": entry["filename"],
+        **job.to_dict(),
+        "ready_for_questions": entry["text"] is not None,
+        "summary": entry["summary"],
+        "summary_kind": entry.get("summary_kind"),
+        "failed_pages": entry["failed_pages"]
+    }
+
+
+@app.get("/summary/{doc_id}")
+async def get_summary(doc_id: str, max_words: Optional[int] = Query(None, ge=20, le=1000),
+                      documents: DocumentStore = Depends(provide_documents),
+                      qa_system=Depends(provide_qa_system)):
+    content_id, entry = await get_ready_document(documents, doc_id)
+    if max_words is None and entry["summary"]:
+        return {"summary": entry["summary"], "summary_kind": entry.get("summary_kind"), "max_words": None}
+
+    async def summarize() -> str:
+        # Reuses the per-chunk map results from ingestion, so only the reduce runs again
+        summary_map = dict(entry.get("summary_map") or {})
+        known = len(summary_map)
+        summary = await qa_system.agenerate_summary(entry["text"], entry["chunks"], summary_map, max_words)
+        if len(summary_map) > known:
+            await run_blocking(documents.update, doc_id, summary_map=summary_map)
+        return summary
+
+    try:
+        summary = await coalesced.do(("summary", content_id, max_words, cache_bypassed()), summarize)
+        return {"summary": summary, "summary_kind": "abstractive", "max_words": max_words}
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating summary: {str(e)}")
+
+
+async def get_ready_document(documents: DocumentStore, doc_id: str) -> Tuple[str, dict]:
+    """Return (content doc_id, entry) once the text is extracted, or raise 404/409/422.
+
+    Store reads can hit SQLite and unpickle chunks and indexes, so both
+    lookups run on the executor rather than the event loop.
+    """
+    content_id, entry = await run_blocking(read_document, documents, doc_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if entry["text"] is None:
+        job = IngestionJob.from_state(entry["job"])
+        if job.status == "failed":
+            errors = [stage["error"] for stage in job.stages.values() if stage["error"]]
+            raise HTTPException(status_code=422, detail=f"Document processing failed: {'; '.join(errors)}")
+        raise HTTPException(status_code=409, detail="Document is still being processed")
+    return content_id, entry
+
+
+def read_document(documents: DocumentStore, doc_id: str) -> Tuple[str, Optional[dict]]:
+    # Aliases share the target's artifacts, so coalescing keys use the target's id
+    return documents.resolve(doc_id), documents.get(doc_id)
+
+
+def check_retrieval_mode(mode: Optional[str]) -> None:
+    if mode is not None and mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown retrieval mode. Use one of: {', '.join(RETRIEVAL_MODES)}")
     
     
 @app.post("/ask/{doc_id}")
-async def ask_question(doc_id: str, question: str):
-    if doc_id not in documents:
-        raise HTTPException(status_code=404, detail="Document not found")
+async def ask_question(doc_id: str, question: str, mode: Optional[str] = Query(None, description="first, lexical, dense or hybrid"),
+                       documents: DocumentStore = Depends(provide_documents),
+                       qa_system=Depends(provide_qa_system)):
+    check_retrieval_mode(mode)
+    content_id, entry = await get_ready_document(documents, doc_id)
     
-    text = documents[doc_id]["text"]
-    answer, justification = qa_system.answer_question(text, question)
+    text = entry["text"]
+    index = entry["index"]
+    answer, justification, sources, context_tokens = await coalesced.do(
+        ("ask", content_id, mode, normalize_text(question), cache_bypassed()),
+        lambda: qa_system.aanswer_question(text, question, index, mode, entry["chunks"])
+    )
     
     return {
         "answer": answer,
-        "justification": justification
+        "justification": justification,
+        "sources": sources,
+        "context_tokens": context_tokens
+    }
+
+
+# Upper bound on questions per /ask_batch request
+BATCH_MAX_QUESTIONS = 50
+
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str]
+    mode: Optional[str] = None
+
+
+@app.post("/ask_batch/{doc_id}")
+async def ask_batch(doc_id: str, request: BatchQuestionRequest,
+                    documents: DocumentStore = Depends(provide_documents),
+                    qa_system=Depends(provide_qa_system)):
+    """Answer several questions with shared retrieval and grouped prompts; failures are reported per question."""
+    check_retrieval_mode(request.mode)
+    questions = [question.strip() for question in request.questions]
+    if not questions or not all(questions):
+        raise HTTPException(status_code=400, detail="Provide at least one non-empty question")
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUESTIONS} questions per batch")
+    _, entry = await get_ready_document(documents, doc_id)
+
+    results = await qa_system.aanswer_batch(entry["text"], questions, entry["index"], request.mode, entry["chunks"])
+    return {
+        "results": results,
+        "failed": sum(1 for result in results if "error" in result)
     }
 
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/ask_stream/{doc_id}")
+async def ask_question_stream(doc_id: str, question: str, mode: Optional[str] = Query(None, description="first, lexical, dense or hybrid"),
+                              documents: DocumentStore = Depends(provide_documents),
+                              qa_system=Depends(provide_qa_system)):
+    """Stream the answer as Server-Sent Events: token, delta (per section), then done or error."""
+    check_retrieval_mode(mode)
+    _, entry = await get_ready_document(documents, doc_id)
+
+    async def events():
+        parser = QAStreamParser()
+        try:
+            context, sources, context_tokens = await qa_system.aselect_context(
+                entry["text"], question, entry["chunks"], entry["index"], mode
+            )
+            async for token in qa_system.astream_answer(entry["text"], question, context=context):
+                yield sse_event("token", {"text": token})
+                for section, delta in parser.feed(token):
+                    yield sse_event("delta", {"section": section, "text": delta})
+            for section, delta in parser.close():
+                yield sse_event("delta", {"section": section, "text": delta})
+            answer, justification = qa_system.parse_qa_response(parser.buffer)
+            yield sse_event("done", {
+                "answer": answer, "justification": justification, "sources": sources, "context_tokens": context_tokens
+            })
+        except Exception as e:
+            yield sse_event("error", {"detail": f"Error answering question: {str(e)}"})
+
+    # X-Accel-Buffering stops reverse proxies from holding back the stream
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def search_corpus(corpus, documents: DocumentStore, query: str, top_k: int) -> list:
+    """Top passages across all documents, with text and doc/offset/page/section citations."""
+    # Picks up documents indexed by other workers since the last sync (usually none: one indexed read)
+    await run_blocking(corpus.sync, documents)
+    hits = corpus.search(query, top_k)
+    entries = await run_blocking(lambda: [documents.get(hit["doc_id"]) for hit in hits])
+    passages = []
+    for hit, entry in zip(hits, entries):
+        if entry is None or entry.get("text") is None:
+            continue
+        passages.append({
+            **hit,
+            "filename": entry.get("filename"),
+            "text": entry["text"][hit["start"]:hit["end"]],
+        })
+    return passages
+
+
+@app.get("/search")
+async def search(q: str = Query(..., min_length=1), top_k: int = Query(CORPUS_TOP_K, ge=1, le=50),
+                 documents: DocumentStore = Depends(provide_documents), corpus=Depends(provide_corpus)):
+    passages = await search_corpus(corpus, documents, q, top_k)
+    return {"query": q, "results": passages}
+
+
+# Upper bound on keywords per /highlight request
+HIGHLIGHT_MAX_KEYWORDS = 200
+
+
+@app.get("/highlight/{doc_id}")
+async def highlight(doc_id: str, keywords: List[str] = Query(..., description="repeat for each keyword"),
+                    whole_words: bool = True, limit: int = Query(50, ge=1, le=1000),
+                    documents: DocumentStore = Depends(provide_documents)):
+    """Sentences containing the keywords, most hits first, with character offsets for highlighting."""
+    terms = tuple(sorted({keyword.strip() for keyword in keywords if keyword.strip()}))
+    if not terms:
+        raise HTTPException(status_code=400, detail="Provide at least one non-empty keyword")
+    if len(terms) > HIGHLIGHT_MAX_KEYWORDS:
+        raise HTTPException(status_code=400, detail=f"At most {HIGHLIGHT_MAX_KEYWORDS} keywords per request")
+    _, entry = await get_ready_document(documents, doc_id)
+
+    # One pass over the text per request; book-length documents take a while, so keep it off the loop
+    matches = await run_blocking(get_matcher(terms, whole_words).match_sentences, entry["text"])
+    ranked = sorted(matches, key=lambda match: (-len(match.hits), match.start))[:limit]
+    return {
+        "doc_id": doc_id,
+        "keywords": list(terms),
+        "total_hits": sum(len(match.hits) for match in matches),
+        "total_sentences": len(matches),
+        "sentences": [
+            {
+                "start": match.start,
+                "end": match.end,
+                "hits": len(match.hits),
+                "matches": [{"start": hit.start, "end": hit.end, "keyword": hit.keyword} for hit in match.hits]
+            }
+            for match in ranked
+        ]
+    }
+
+
+@app.post("/ask_corpus")
+async def ask_corpus(question: str, top_k: int = Query(CORPUS_TOP_K, ge=1, le=20),
+                     documents: DocumentStore = Depends(provide_documents), corpus=Depends(provide_corpus),
+                     qa_system=Depends(provide_qa_system)):
+    passages = await search_corpus(corpus, documents, question, top_k)
+    if not passages:
+        raise HTTPException(status_code=404, detail="No uploaded document matches the question")
+    for passage in passages:
+        page = f", p. {passage['page']}" if passage["page"] else ""
+        passage["label"] = f"{passage['filename']}{page}"
+    try:
+        answer, justification = await qa_system.aanswer_corpus(question, passages)
+    except LLMUnavailableError:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    sources = [
+        {key: passage[key] for key in ("doc_id", "filename", "chunk_id", "start", "end", "page", "section", "score")}
+        for passage in passages
+    ]
+    return {"answer": answer, "justification": justification, "sources": sources}
+
+
 @app.get("/challenge/{doc_id}")
-def challenge_me(doc_id: str):
-    if doc_id not in documents:
-        raise HTTPException(status_code=404, detail="Document not found")
+async def challenge_me(doc_id: str, refresh: bool = Query(False, description="Replace the stored questions with new ones"),
+                       documents: DocumentStore = Depends(provide_documents),
+                       qa_system=Depends(provide_qa_system)):
+    content_id, entry = await get_ready_document(documents, doc_id)
+    # /evaluate grades by position in the stored set, so it only changes when asked to
+    if entry.get("questions") and not refresh:
+        questions = entry["questions"]
+        return {"questions": questions, "question_ids": list(range(len(questions)))}
     try:
-        text = documents[doc_id]["text"]  # ✅ corrected key here
-        print(f"Challenge request received for doc_id: {doc_id}")
-        questions = qa_system.generate_questions(text)
+        text = entry["text"]  # ✅ corrected key here
+        logger.info("Challenge request received for doc_id: %s", doc_id)
+
+        async def generate() -> List[str]:
+            # Same prompt as last time: without the bypass the LLM cache would hand back the old set
+            token = set_cache_bypass(True) if refresh else None
+            try:
+                questions = await qa_system.agenerate_questions(text, chunks=entry["chunks"])
+            finally:
+                if token is not None:
+                    reset_cache_bypass(token)
+            if questions:
+                # Keep the set so /evaluate grades exactly the question the user was shown
+                await run_blocking(documents.update, doc_id, questions=questions)
+            return questions
+
+        # A class pressing "Challenge Me" together gets one question set; each refresh gets its own
+        key = ("challenge", content_id, uuid.uuid4().hex) if refresh else ("challenge", content_id, cache_bypassed())
+        questions = await coalesced.do(key, generate)
         if not questions:
             raise HTTPException(status_code=500, detail="No questions could be generated.")
-        return {"questions": questions}
+        return {"questions": questions, "question_ids": list(range(len(questions)))}
+    except (HTTPException, LLMUnavailableError):
+        raise
     except Exception as e:
-        print(f"Error generating questions: {str(e)}")
+        logger.exception("Error generating questions for doc_id %s", doc_id)
         raise HTTPException(status_code=500, detail=f"Error generating questions: {str(e)}")
 
 
@@ -155,16 +562,28 @@ class AnswerRequest(BaseModel):
     answer: str
 
 @app.post("/evaluate/{doc_id}/{question_id}")
-async def evaluate_answer(doc_id: str, question_id: int, request: AnswerRequest):
+async def evaluate_answer(doc_id: str, question_id: int, request: AnswerRequest,
+                          documents: DocumentStore = Depends(provide_documents),
+                          qa_system=Depends(provide_qa_system)):
     answer = request.answer
-    if doc_id not in documents:
-        raise HTTPException(status_code=404, detail="Document not found")
-    text = documents[doc_id]["text"]
-    evaluation = qa_system.evaluate_answer(text, question_id, answer)
+    content_id, entry = await get_ready_document(documents, doc_id)
+    question = get_question_by_id(entry, question_id)
+    if question is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Question not found. Generate questions with /challenge first"
+        )
+    text = entry["text"]
+    index = entry["index"]
+    evaluation = await coalesced.do(
+        ("evaluate", content_id, normalize_text(question), " ".join(answer.split()), cache_bypassed()),
+        lambda: qa_system.aevaluate_answer(text, question, answer, index, entry["chunks"])
+    )
     return {"evaluation": evaluation}
     
-def get_question_by_id(self, doc_id, question_id):
-    try:
-        return self.generated_questions[doc_id][question_id]
-    except:
-        return "Question not found."
+def get_question_by_id(entry: dict, question_id: int) -> Optional[str]:
+    """Look up a question from the last set generated by /challenge for the document."""
+    questions = entry.get("questions") or []
+    if 0 <= question_id < len(questions):
+        return questions[question_id]
+    return None
@@ -0,0 +1,300 @@
+import asyncio
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Add a Server-Timing header with per-stage durations to every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage durations of the current request, collected for the Server-Timing header
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None
+)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    """Base for thread-safe, process-local instruments with optional labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        """Return (name suffix, labels, value) triples for rendering."""
+        with self._lock:
+            return [("", dict(zip(self.labelnames, key)), value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                labels = dict(zip(self.labelnames, key))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+                samples.append(("_sum", labels, total))
+                samples.append(("_count", labels, count))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """Metric whose samples are read from a callback at scrape time (e.g. existing stats dicts)."""
+
+    def __init__(self, name: str, documentation: str, kind: str,
+                 callback: Callable[[], Iterable[Tuple[Dict[str, str], float]]]):
+        super().__init__(name, documentation)
+        self.kind = kind
+        self.callback = callback
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        return [("", labels, value) for labels, value in self.callback()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "research_assistant_stage_duration_seconds",
+    "Duration of processing stages by component.",
+    ("component", "stage")
+))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    "research_assistant_http_request_duration_seconds",
+    "Time until response headers are sent, by route.",
+    ("method", "route", "status")
+))
+HTTP_INFLIGHT = REGISTRY.register(Gauge(
+    "research_assistant_http_inflight_requests",
+    "HTTP requests currently being handled."
+))
+LLM_REQUESTS = REGISTRY.register(Counter(
+    "research_assistant_llm_requests_total",
+    "LLM completions by operation and outcome (success, error, cancelled, cache_hit).",
+    ("operation", "outcome")
+))
+LLM_SECONDS = REGISTRY.register(Histogram(
+    "research_assistant_llm_request_duration_seconds",
+    "Latency of LLM API calls that reached the network.",
+    ("operation",)
+))
+LLM_INFLIGHT = REGISTRY.register(Gauge(
+    "research_assistant_llm_inflight_requests",
+    "LLM API calls currently waiting on the network."
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "research_assistant_llm_tokens_total",
+    "Tokens reported by the LLM API.",
+    ("kind",)
+))
+LLM_BYTES = REGISTRY.register(Counter(
+    "research_assistant_llm_bytes_total",
+    "Bytes sent to and received from the LLM API.",
+    ("direction",)
+))
+LLM_RESILIENCE_EVENTS = REGISTRY.register(Counter(
+    "research_assistant_llm_resilience_events_total",
+    "Retries, hedges, fallbacks, timeouts and circuit breaker decisions, by model.",
+    ("event", "model")
+))
+CONTEXT_TOKENS = REGISTRY.register(Histogram(
+    "research_assistant_qa_context_tokens",
+    "Estimated tokens of document context packed into each QA or evaluation prompt.",
+    buckets=(50, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 8000)
+))
+SINGLEFLIGHT_CALLS = REGISTRY.register(Counter(
+    "research_assistant_singleflight_calls_total",
+    "Coalesced calls by group and role (leader ran the work, shared awaited an identical in-flight call).",
+    ("group", "role")
+))
+LLM_BREAKER_STATE = REGISTRY.register(Gauge(
+    "research_assistant_llm_circuit_breaker_state",
+    "Circuit breaker state per model (0 closed, 1 half-open, 2 open).",
+    ("model",)
+))
+
+
+def record_timing(name: str, seconds: float) -> None:
+    """Add a duration to the current request's Server-Timing entries, if collecting."""
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def start_request_timing() -> contextvars.Token:
+    return _request_timings.set({})
+
+
+def finish_request_timing(token: contextvars.Token) -> Dict[str, float]:
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def format_server_timing(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+@contextmanager
+def timed(component: str, stage: str) -> Iterator[None]:
+    """Time a block into the stage histogram and the request's Server-Timing header."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, component=component, stage=stage)
+        record_timing(f"{component}-{stage}", elapsed)
+
+
+@contextmanager
+def track_llm_request(operation: str) -> Iterator[None]:
+    """Count, time and gauge one LLM API call."""
+    LLM_INFLIGHT.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    except asyncio.CancelledError:
+        # The losing request of a hedged pair, or a client that went away
+        outcome = "cancelled"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        LLM_INFLIGHT.dec()
+        LLM_SECONDS.observe(elapsed, operation=operation)
+        LLM_REQUESTS.inc(operation=operation, outcome=outcome)
+        record_timing("llm", elapsed)
+
+
+def record_llm_usage(usage: Optional[Dict]) -> None:
+    """Count prompt/completion tokens from an API ``usage`` object."""
+    if not isinstance(usage, dict):
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if isinstance(tokens, (int, float)) and tokens > 0:
+            LLM_TOKENS.inc(tokens, kind=kind)
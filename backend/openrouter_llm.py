@@ -1,19 +1,75 @@
-from langchain.llms.base import LLM
-from typing import Optional, List, Mapping, Any
-import requests
+from typing import Optional, List, Any, Dict, Tuple, AsyncIterator, TYPE_CHECKING
+import asyncio
+import json
+import weakref
 import os
 from dotenv import load_dotenv
+from backend.llm_cache import LLMCache, cache_bypassed, get_llm_cache
+from backend.metrics import LLM_BYTES, LLM_REQUESTS, record_llm_usage, track_llm_request
+from backend.resilience import RETRYABLE_STATUSES, LLMError, error_for_status, get_resilience
+from backend.singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    import httpx
 
 load_dotenv()
 
-class OpenRouterLLM(LLM):
-    @property
-    def _llm_type(self) -> str:
-        return "openrouter"
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Connection pool and timeout settings shared by every OpenRouterLLM instance
+POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "20"))
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "60"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "30"))
+
+# One async client per event loop: httpx connections cannot be shared across loops
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+# Identical prompts already on the wire are awaited rather than sent again
+_in_flight = SingleFlight("llm")
+
+
+def get_async_client() -> "httpx.AsyncClient":
+    """Return the pooled async client bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        import httpx
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE,
+                max_keepalive_connections=POOL_SIZE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def _read_timeout(remaining: float) -> float:
+    """Per-read timeout for an attempt: never past the call's deadline."""
+    return max(0.05, min(READ_TIMEOUT, remaining))
+
+
+async def aclose_transport() -> None:
+    """Close the async client of the running loop (call on app shutdown)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+class OpenRouterLLM:
+    """Completion client for the OpenRouter chat API, with caching and metrics.
+
+    ``ainvoke`` returns the whole completion and ``astream`` yields text
+    deltas, so prompts are plain formatted strings with no chain
+    framework in between. Network attempts go through backend.resilience
+    (deadline, retries, hedging, circuit breaker, fallback models).
+    """
 
-    def _call(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+    def _build_request(self, prompt: str, stop: Optional[List[str]] = None) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Build the headers and JSON body for a chat completion request."""
         api_key = os.getenv("OPENROUTER_API_KEY")
-        print(api_key)
         if not api_key:
             raise ValueError("OPENROUTER_API_KEY not set in environment")
 
@@ -39,21 +95,134 @@ class OpenRouterLLM(LLM):
             "model": model,
             "messages": [{"role": "user", "content": prompt}]
         }
+        if stop:
+            data["stop"] = stop
 
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data
-        )
+        return headers, data
+
+    def _parse_response(self, status_code: int, body: str, retry_after: Optional[str] = None) -> str:
+        """Extract the completion text from a raw API response."""
+        if status_code != 200:
+            raise error_for_status(status_code, body, retry_after)
+
+        try:
+            payload = json.loads(body)
+            content = payload["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise LLMError(f"Unexpected API response structure: {body}")
+        record_llm_usage(payload.get("usage"))
+        return content
+
+    async def _acached(self, cache_key: Optional[str], operation: str) -> Optional[str]:
+        if not cache_key:
+            return None
+        cached = await get_llm_cache().aget(cache_key)
+        if cached is not None:
+            LLM_REQUESTS.inc(operation=operation, outcome="cache_hit")
+        return cached
+
+    def _request_key(self, data: Dict[str, Any]) -> str:
+        params = {k: v for k, v in data.items() if k not in ("model", "messages")}
+        return LLMCache.make_key(data["model"], data["messages"][0]["content"], params)
 
-        if response.status_code != 200:
-            raise ValueError(f"OpenRouter API Error: {response.text}")
+    def _cache_key(self, data: Dict[str, Any]) -> Optional[str]:
+        return self._request_key(data) if get_llm_cache() is not None else None
 
+    async def ainvoke(self, prompt: str, stop: Optional[List[str]] = None) -> str:
+        headers, data = self._build_request(prompt, stop)
+        cache_key = self._cache_key(data)
+        cached = await self._acached(cache_key, "acall")
+        if cached is not None:
+            return cached
+
+        async def complete() -> str:
+            content = await get_resilience().acall(
+                "acall", data["model"], lambda model, timeout: self._apost(headers, data, model, timeout)
+            )
+            if cache_key:
+                await get_llm_cache().aset(cache_key, content)
+            return content
+
+        # No-cache callers share only with each other, so they always get a call of their own kind
+        return await _in_flight.do((self._request_key(data), cache_bypassed()), complete)
+
+    async def _apost(self, headers: Dict[str, str], data: Dict[str, Any], model: str, timeout: float) -> str:
+        """One network attempt for ``ainvoke``."""
+        import httpx
+        body = json.dumps({**data, "model": model}).encode("utf-8")
+        with track_llm_request("acall"):
+            try:
+                response = await get_async_client().post(
+                    OPENROUTER_API_URL,
+                    headers=headers,
+                    content=body,
+                    timeout=httpx.Timeout(_read_timeout(timeout), connect=CONNECT_TIMEOUT)
+                )
+            except httpx.TransportError as e:
+                raise LLMError(f"OpenRouter request failed: {e!r}", retryable=True)
+            LLM_BYTES.inc(len(body), direction="sent")
+            LLM_BYTES.inc(len(response.content), direction="received")
+            return self._parse_response(response.status_code, response.text, response.headers.get("Retry-After"))
+
+    def _parse_stream_line(self, line: str) -> Optional[str]:
+        """Return the content delta of one SSE line, or None for comments/keep-alives."""
+        if not line.startswith("data:"):
+            return None
+        payload = line[len("data:"):].strip()
+        if not payload or payload == "[DONE]":
+            return None
         try:
-            return response.json()["choices"][0]["message"]["content"]
-        except (KeyError, IndexError):
-            raise ValueError(f"Unexpected API response structure: {response.text}")
+            event = json.loads(payload)
+        except ValueError:
+            return None
+        if "error" in event:
+            error = event["error"]
+            code = error.get("code") if isinstance(error, dict) else None
+            raise LLMError(f"OpenRouter API Error: {error}", status=code if isinstance(code, int) else None,
+                           retryable=code in RETRYABLE_STATUSES)
+        # The final event of a stream may carry the token usage
+        record_llm_usage(event.get("usage"))
+        choices = event.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or None
+
+    async def astream(self, prompt: str, stop: Optional[List[str]] = None) -> AsyncIterator[str]:
+        headers, data = self._build_request(prompt, stop)
+        cache_key = self._cache_key(data)
+        cached = await self._acached(cache_key, "astream")
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        async for delta in get_resilience().astream(
+            "astream", data["model"], lambda model, timeout: self._astream_attempt(headers, data, model, timeout)
+        ):
+            parts.append(delta)
+            yield delta
+        if cache_key:
+            await get_llm_cache().aset(cache_key, "".join(parts))
 
-    @property
-    def _identifying_params(self) -> Mapping[str, Any]:
-        return {"model": os.getenv("OPENROUTER_MODEL", "mistralai/mistral-7b-instruct")}
+    async def _astream_attempt(self, headers: Dict[str, str], data: Dict[str, Any], model: str,
+                               timeout: float) -> AsyncIterator[str]:
+        import httpx
+        body = json.dumps({**data, "model": model, "stream": True}).encode("utf-8")
+        with track_llm_request("astream"):
+            try:
+                async with get_async_client().stream(
+                    "POST",
+                    OPENROUTER_API_URL,
+                    headers=headers,
+                    content=body,
+                    timeout=httpx.Timeout(_read_timeout(timeout), connect=CONNECT_TIMEOUT)
+                ) as response:
+                    LLM_BYTES.inc(len(body), direction="sent")
+                    if response.status_code != 200:
+                        error = (await response.aread()).decode("utf-8", "replace")
+                        raise error_for_status(response.status_code, error, response.headers.get("Retry-After"))
+                    async for line in response.aiter_lines():
+                        LLM_BYTES.inc(len(line) + 1, direction="received")
+                        delta = self._parse_stream_line(line)
+                        if delta:
+                            yield delta
+            except httpx.TransportError as e:
+                raise LLMError(f"OpenRouter request failed: {e!r}", retryable=True)
@@ -0,0 +1,146 @@
+import io
+import mmap
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from PyPDF2 import PdfReader
+
+# This module is imported by pool workers, so keep its imports light
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "0"))  # 0 means no cap
+# Below this many pages the pool round-trip costs more than it saves
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+class EncryptedPdfError(Exception):
+    """Raised when a PDF cannot be decrypted with an empty password."""
+
+
+@dataclass
+class PdfExtraction:
+    text: str
+    num_pages: int
+    # Character offset in ``text`` where each extracted page starts
+    page_offsets: List[int] = field(default_factory=list)
+    failed_pages: List[Dict] = field(default_factory=list)
+    truncated: bool = False
+
+
+@contextmanager
+def _pdf_stream(source: Union[bytes, str]) -> Iterator:
+    """A seekable stream over PDF bytes, or a read-only memory map of a PDF file path.
+
+    The map is backed by the page cache, so parsing a file never holds a
+    private copy of it and pool workers share the pages.
+    """
+    if isinstance(source, bytes):
+        yield io.BytesIO(source)
+        return
+    with open(source, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        yield mapped
+
+
+def _open_reader(source) -> "PdfReader":
+    # PyPDF2 is only needed once a PDF arrives, so keep it off the startup path
+    from PyPDF2 import PdfReader
+    reader = PdfReader(source)
+    if reader.is_encrypted:
+        try:
+            reader.decrypt("")
+        except Exception:
+            raise EncryptedPdfError("PDF is password protected and cannot be processed")
+    return reader
+
+
+def _extract_page_range(source: Union[bytes, str], start: int, end: int) -> List[Tuple[int, str, Optional[str]]]:
+    """Extract and whitespace-normalise pages [start, end); runs inside a pool worker."""
+    results = []
+    with _pdf_stream(source) as stream:
+        reader = _open_reader(stream)
+        for page_number in range(start, end):
+            try:
+                page_text = reader.pages[page_number].extract_text() or ""
+                results.append((page_number, _WHITESPACE_RE.sub(" ", page_text).strip(), None))
+            except Exception as e:
+                results.append((page_number, "", str(e)))
+    return results
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn avoids forking a multi-threaded server process
+                _pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def extract_pdf(source: Union[bytes, str], workers: int = PDF_WORKERS, max_pages: int = PDF_MAX_PAGES) -> PdfExtraction:
+    """Extract text from PDF bytes or a PDF file path, splitting page ranges across a process pool.
+
+    Pass a path for large files: workers then map the file themselves
+    instead of each receiving a pickled copy of the bytes.
+    """
+    with _pdf_stream(source) as stream:
+        num_pages = len(_open_reader(stream).pages)
+    page_limit = min(num_pages, max_pages) if max_pages > 0 else num_pages
+
+    if workers > 1 and page_limit >= PDF_PARALLEL_MIN_PAGES:
+        # Several ranges per worker so slow pages don't leave cores idle
+        step = max(1, -(-page_limit // (workers * 4)))
+        pool = _get_pool(workers)
+        futures = [
+            pool.submit(_extract_page_range, source, start, min(start + step, page_limit))
+            for start in range(0, page_limit, step)
+        ]
+        page_results = [page for future in futures for page in future.result()]
+    else:
+        page_results = _extract_page_range(source, 0, page_limit)
+
+    # Join once at the end so assembly stays linear in document size
+    parts: List[str] = []
+    page_offsets: List[int] = []
+    failed_pages: List[Dict] = []
+    length = 0
+    for page_number, page_text, error in page_results:
+        if error is not None:
+            failed_pages.append({"page": page_number + 1, "error": error})
+        if page_text and parts:
+            length += 1  # the joining space
+        page_offsets.append(length)
+        if page_text:
+            parts.append(page_text)
+            length += len(page_text)
+
+    return PdfExtraction(
+        text=" ".join(parts),
+        num_pages=num_pages,
+        page_offsets=page_offsets,
+        failed_pages=failed_pages,
+        truncated=page_limit < num_pages,
+    )
@@ -1,18 +1,84 @@
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
 from backend.openrouter_llm import OpenRouterLLM
-from typing import List, Tuple, Dict
+from backend.concurrency import run_blocking
+from backend.retrieval import BM25Index, ChunkRetriever, DenseIndex
+from backend.chunking import ChunkTable, build_chunk_table
+from backend.summarizer import SummaryEngine
+from backend.context import QA_CONTEXT_TOKENS, estimate_tokens, pack_context
+from backend.metrics import CONTEXT_TOKENS, timed
+from backend.resilience import LLMUnavailableError
+from typing import List, Tuple, Dict, Optional, AsyncIterator
+import asyncio
+import os
 import re
 import io
 
+
+class QAStreamParser:
+    """Incrementally split a streamed QA response into its Answer/Support/Confidence sections.
+
+    ``feed`` returns (section, text) deltas as soon as they are safe to show;
+    a few trailing characters are held back in case they start the next
+    section marker.
+    """
+
+    MARKERS = (("answer", "Answer:"), ("support", "Support:"), ("confidence", "Confidence:"))
+    HOLDBACK = max(len(marker) for _, marker in MARKERS) - 1
+
+    def __init__(self):
+        self.buffer = ""
+        self.emitted = {name: 0 for name, _ in self.MARKERS}
+
+    def feed(self, token: str) -> List[Tuple[str, str]]:
+        self.buffer += token
+        return self._drain(final=False)
+
+    def close(self) -> List[Tuple[str, str]]:
+        """Flush whatever was held back once the stream has ended."""
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> List[Tuple[str, str]]:
+        found = sorted(
+            (index, name, marker)
+            for name, marker in self.MARKERS
+            for index in [self.buffer.find(marker)]
+            if index >= 0
+        )
+        deltas = []
+        for position, (index, name, marker) in enumerate(found):
+            is_last = position == len(found) - 1
+            end = len(self.buffer) if is_last else found[position + 1][0]
+            section = self.buffer[index + len(marker):end].lstrip()
+            if not is_last:
+                section = section.rstrip()
+            safe_end = len(section)
+            if is_last and not final:
+                # Hold back a possible partial marker and any trailing whitespace
+                safe_end = len(section[:max(0, len(section) - self.HOLDBACK)].rstrip())
+            if final:
+                safe_end = len(section.rstrip())
+            if safe_end > self.emitted[name]:
+                deltas.append((name, section[self.emitted[name]:safe_end]))
+                self.emitted[name] = safe_end
+        return deltas
+
+
 class QASystem:
     def __init__(self):
         self.llm = OpenRouterLLM()
+        # Number of retrieved chunks packed into the QA/evaluation context
+        self.top_k = int(os.getenv("QA_TOP_K", "3"))
+        self.retrieval_mode = os.getenv("QA_RETRIEVAL_MODE", "lexical")
+        # Retrieved chunks are compressed to the question-relevant sentences within a token budget
+        self.context_packing = os.getenv("QA_CONTEXT_PACKING", "1") == "1"
+        self.context_tokens = QA_CONTEXT_TOKENS
+        # The hashing embedder is cheap, so dense retrieval is on unless disabled
+        self.dense_retrieval = os.getenv("DENSE_RETRIEVAL", "1") == "1"
+        # Batch QA: questions per combined prompt and concurrent LLM calls per batch
+        self.batch_group_size = int(os.getenv("BATCH_QA_GROUP_SIZE", "5"))
+        self.batch_concurrency = int(os.getenv("BATCH_QA_CONCURRENCY", "4"))
         
-        # Improved prompt templates
-        self.qa_prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template="""
+        # Prompt templates, rendered with str.format and sent straight to the LLM
+        self.qa_prompt = """
             As a research assistant, carefully analyze the context and provide:
             1. A direct answer to the question
             2. Relevant context supporting the answer
@@ -26,11 +92,47 @@ class QASystem:
             Support: [supporting text]
             Confidence: [High/Medium/Low]
             """
-        )
         
-        self.question_generation_prompt = PromptTemplate(
-            input_variables=["context"],
-            template="""
+        self.batch_qa_prompt = """
+            As a research assistant, carefully analyze the context and answer each numbered question.
+            For every question provide:
+            1. A direct answer to the question
+            2. Relevant context supporting the answer
+            3. Confidence level (High/Medium/Low)
+            
+            Context: {context}
+            
+            Questions:
+            {questions}
+            
+            Format your response as one block per question, in the same order:
+            ### Q1
+            Answer: [your answer]
+            Support: [supporting text]
+            Confidence: [High/Medium/Low]
+            ### Q2
+            Answer: [your answer]
+            Support: [supporting text]
+            Confidence: [High/Medium/Low]
+            """
+        
+        self.corpus_qa_prompt = """
+            As a research assistant, answer the question using the numbered sources below,
+            which come from different documents. Cite the sources you rely on as [1], [2], ...
+            and say so if the sources do not contain the answer.
+            
+            Sources:
+            {sources}
+            
+            Question: {question}
+            
+            Format your response as:
+            Answer: [your answer with citations]
+            Support: [supporting text with citations]
+            Confidence: [High/Medium/Low]
+            """
+        
+        self.question_generation_prompt = """
             Generate 3 high-quality questions about the following text.
             Questions should be:
             - Clear and specific
@@ -45,11 +147,8 @@ class QASystem:
             Q2. [question text]
             Q3. [question text]
             """
-        )
         
-        self.evaluation_prompt = PromptTemplate(
-            input_variables=["context", "question", "answer"],
-            template="""
+        self.evaluation_prompt = """
             Evaluate this answer to the question based on the context:
             
             Question: {question}
@@ -66,112 +165,277 @@ class QASystem:
             Evaluation: [your evaluation]
             Ideal Answer: [suggested answer]
             """
-        )
         
-        # Initialize chains with error handling
-        try:
-            self.qa_chain = LLMChain(llm=self.llm, prompt=self.qa_prompt)
-            self.question_chain = LLMChain(llm=self.llm, prompt=self.question_generation_prompt)
-            self.evaluation_chain = LLMChain(llm=self.llm, prompt=self.evaluation_prompt)
-        except Exception as e:
-            raise RuntimeError(f"Failed to initialize QA chains: {str(e)}")
+        self.summary_prompt = """
+            Provide a clear, concise {length} summary of the following academic text for a student:
+            
+            {context}
+            
+            Summary:
+            """
+        
+        self.summary_engine = SummaryEngine(self.llm, self.summary_prompt)
+
+    def build_index(self, chunks: List[str], doc_id: Optional[str] = None) -> ChunkRetriever:
+        """Build the retrieval indexes for a document's chunks (once, at upload)."""
+        dense = None
+        if self.dense_retrieval:
+            dense = DenseIndex.load_or_build(doc_id, chunks) if doc_id else DenseIndex.build(chunks)
+        return ChunkRetriever(BM25Index.build(chunks), dense)
+
+    async def astream_answer(self, text: str, question: str, index: Optional[ChunkRetriever] = None,
+                             mode: Optional[str] = None, chunks: Optional[ChunkTable] = None,
+                             context: Optional[str] = None) -> AsyncIterator[str]:
+        """Stream the raw QA completion token by token; parse it with QAStreamParser.
+
+        Pass ``context`` from select_context to reuse a retrieval already done.
+        """
+        if not text or not question:
+            raise ValueError("Text and question must be provided")
+
+        if context is None:
+            context, _, _ = await self.aselect_context(text, question, chunks, index, mode)
+        prompt = self.qa_prompt.format(context=context, question=question)
+        async for token in self.llm.astream(prompt):
+            yield token
 
-    def answer_question(self, text: str, question: str) -> Tuple[str, str]:
-        """Answer a question based on the provided text."""
+    async def aanswer_question(self, text: str, question: str, index: Optional[ChunkRetriever] = None,
+                               mode: Optional[str] = None, chunks: Optional[ChunkTable] = None) -> Tuple[str, str, List[Dict], int]:
+        """Answer a question based on the provided text.
+
+        Returns the answer, its justification, a citation (offsets, page,
+        section) for each chunk the answer was drawn from, and the number of
+        context tokens sent to the model.
+        """
         if not text or not question:
             raise ValueError("Text and question must be provided")
             
         try:
-            chunks = self._split_text(text)
-            relevant_chunk = self._find_most_relevant_chunk(chunks, question)
-            result = self.qa_chain.run({
-                "context": relevant_chunk,
-                "question": question
-            })
-            return self._parse_qa_response(result)
+            relevant_chunk, sources, context_tokens = await self.aselect_context(text, question, chunks, index, mode)
+            with timed("qa", "answer"):
+                result = await self.llm.ainvoke(self.qa_prompt.format(
+                    context=relevant_chunk,
+                    question=question
+                ))
+            return (*self.parse_qa_response(result), sources, context_tokens)
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Error answering question: {str(e)}")
+
+    async def aanswer_batch(self, text: str, questions: List[str], index: Optional[ChunkRetriever] = None,
+                            mode: Optional[str] = None, chunks: Optional[ChunkTable] = None) -> List[Dict]:
+        """Answer many questions about one document with as few LLM calls as possible.
+
+        Retrieval runs once for all questions, questions whose retrieved chunks
+        overlap share a combined prompt, and the prompts run concurrently.
+        Returns one dict per question, in order, with either answer/justification,
+        sources and context_tokens or an error.
+        """
+        if not text or not questions:
+            raise ValueError("Text and questions must be provided")
+
+        mode = mode or self.retrieval_mode
+        table = self._chunk_table(text, chunks)
+        with timed("qa", "retrieve"):
+            if index is not None:
+                hits = await run_blocking(index.search_many, questions, self.top_k, mode)
+            else:
+                hits = [[] for _ in questions]
+        # An empty hit list means first-chunk context, same as select_context
+        chunk_sets = [frozenset(chunk_id for chunk_id, _ in h) or frozenset([0]) for h in hits]
+
+        results: List[Optional[Dict]] = [None] * len(questions)
+        semaphore = asyncio.Semaphore(self.batch_concurrency)
+
+        async def run_group(members: List[int], chunk_ids: frozenset) -> None:
+            # A single question packs exactly like /ask, so it shares its cache entries; a group
+            # scores sentences against all of its questions and gets a budget per question
+            context, sources, context_tokens = await run_blocking(
+                self._pack_context, " ".join(questions[i] for i in members), text, table, sorted(chunk_ids),
+                self.context_tokens * len(members)
+            )
+            answered: Dict[int, Tuple[str, str]] = {}
+            try:
+                async with semaphore:
+                    if len(members) == 1:
+                        # Same prompt as /ask, so single questions share its cache entries
+                        response = await self.llm.ainvoke(self.qa_prompt.format(context=context, question=questions[members[0]]))
+                        answered[0] = self.parse_qa_response(response)
+                    else:
+                        numbered = "\n".join(f"Q{n}. {questions[i]}" for n, i in enumerate(members, 1))
+                        response = await self.llm.ainvoke(self.batch_qa_prompt.format(context=context, questions=numbered))
+                        answered = {n - 1: qa for n, qa in self._parse_batch_qa_response(response).items()}
+                # Questions the model skipped in a combined answer get a prompt of their own
+                for position in range(len(members)):
+                    if position not in answered and len(members) > 1:
+                        async with semaphore:
+                            response = await self.llm.ainvoke(
+                                self.qa_prompt.format(context=context, question=questions[members[position]])
+                            )
+                        answered[position] = self.parse_qa_response(response)
+                for position, i in enumerate(members):
+                    answer, justification = answered[position]
+                    results[i] = {
+                        "question": questions[i],
+                        "answer": answer,
+                        "justification": justification,
+                        "sources": sources,
+                        "context_tokens": context_tokens
+                    }
+            except Exception as e:
+                for i in members:
+                    if results[i] is None:
+                        results[i] = {"question": questions[i], "error": f"Error answering question: {str(e)}"}
+
+        with timed("qa", "batch_answer"):
+            await asyncio.gather(*(run_group(members, chunk_ids)
+                                   for members, chunk_ids in self._group_questions(chunk_sets)))
+        return results
+
+    async def aanswer_corpus(self, question: str, passages: List[Dict]) -> Tuple[str, str]:
+        """Answer from passages of several documents; each passage needs "text" and "label"."""
+        if not question or not passages:
+            raise ValueError("Question and passages must be provided")
+
+        sources = "\n\n".join(
+            f"[{n}] ({passage['label']}) {passage['text']}" for n, passage in enumerate(passages, 1)
+        )
+        try:
+            with timed("qa", "corpus_answer"):
+                result = await self.llm.ainvoke(self.corpus_qa_prompt.format(sources=sources, question=question))
+            return self.parse_qa_response(result)
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Error answering question: {str(e)}")
 
+    def _group_questions(self, chunk_sets: List[frozenset]) -> List[Tuple[List[int], frozenset]]:
+        """Greedily group questions whose contexts overlap, keeping each prompt near top_k chunks."""
+        groups: List[Tuple[List[int], frozenset]] = []
+        for i, chunk_ids in enumerate(chunk_sets):
+            for position, (members, group_ids) in enumerate(groups):
+                merged = group_ids | chunk_ids
+                if (len(members) < self.batch_group_size and group_ids & chunk_ids
+                        and len(merged) <= self.top_k + 1):
+                    groups[position] = (members + [i], merged)
+                    break
+            else:
+                groups.append(([i], chunk_ids))
+        return groups
+
   
-    def generate_summary(self, text: str) -> str:
-        """Generate a concise summary for the provided text."""
+    async def agenerate_summary(self, text: str, chunks: Optional[ChunkTable] = None,
+                                map_cache: Optional[Dict[str, str]] = None, max_words: Optional[int] = None) -> str:
+        """Generate a concise summary covering the whole document.
+
+        Pass ``map_cache`` (persisted per document) to reuse per-chunk results.
+        """
         if not text:
             raise ValueError("Text must be provided for summary generation")
         
         try:
-            summary_prompt = PromptTemplate(
-                input_variables=["context"],
-                template="""
-                Provide a clear, concise 5-7 sentence summary of the following academic text for a student:
-                
-                {context}
-                
-                Summary:
-                """
-            )
-            summary_chain = LLMChain(llm=self.llm, prompt=summary_prompt)
-            chunks = self._split_text(text)
-            main_chunk = chunks[0]
-            summary = summary_chain.run({"context": main_chunk})
-            return summary.strip()
+            with timed("qa", "summarize"):
+                return await self.summary_engine.asummarize(
+                    self._chunk_table(text, chunks).texts(text), map_cache, length=self._summary_length(max_words)
+                )
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Error generating summary: {str(e)}")
 
+    def _summary_length(self, max_words: Optional[int]) -> str:
+        return f"{max_words}-word" if max_words else "5-7 sentence"
 
-
-    def generate_questions(self, text: str, num_questions: int = 3) -> list:
+    async def agenerate_questions(self, text: str, num_questions: int = 3,
+                                  chunks: Optional[ChunkTable] = None) -> list:
         """Generate comprehension questions from the provided text."""
         if not text:
             raise ValueError("Text must be provided for question generation")
 
         try:
-            chunks = self._split_text(text)
-            main_chunk = chunks[0]
-            result = self.question_chain.run({"context": main_chunk})
+            main_chunk = self._chunk_table(text, chunks).chunk(text, 0)
+            with timed("qa", "questions"):
+                result = await self.llm.ainvoke(self.question_generation_prompt.format(context=main_chunk))
             questions = self._parse_generated_questions(result)
             return questions[:num_questions]
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Error generating questions: {str(e)}")
 
-    def evaluate_answer(self, text: str, question_id: int, answer: str) -> Dict:
-        """Evaluate a user's answer to a question."""
-        if not text or not answer or question_id < 0:
+    async def aevaluate_answer(self, text: str, question: str, answer: str, index: Optional[ChunkRetriever] = None,
+                               chunks: Optional[ChunkTable] = None) -> Dict:
+        """Evaluate a user's answer to a previously generated question."""
+        if not text or not question or not answer:
             raise ValueError("Invalid input parameters")
             
         try:
-            questions = self.generate_questions(text)
-            if question_id >= len(questions):
-                return {"error": "Invalid question ID"}
-                
-            question = questions[question_id]
-            relevant_chunk = self._find_most_relevant_chunk(self._split_text(text), question)
-            
-            evaluation = self.evaluation_chain.run({
-                "context": relevant_chunk,
-                "question": question,
-                "answer": answer
-            })
+            relevant_chunk, _, _ = await self.aselect_context(text, question, chunks, index)
+            
+            with timed("qa", "evaluate"):
+                evaluation = await self.llm.ainvoke(self.evaluation_prompt.format(
+                    context=relevant_chunk,
+                    question=question,
+                    answer=answer
+                ))
             
             return {
                 "question": question,
                 "user_answer": answer,
                 "evaluation": self._parse_evaluation(evaluation)
             }
+        except LLMUnavailableError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Error evaluating answer: {str(e)}")
 
     # Helper methods
-    def _split_text(self, text: str, chunk_size: int = 2000) -> List[str]:
-        """Split text into manageable chunks."""
-        return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
+    def select_context(self, text: str, question: str, chunks: Optional[ChunkTable] = None,
+                       index: Optional[ChunkRetriever] = None, mode: Optional[str] = None) -> Tuple[str, List[Dict], int]:
+        """Build the prompt context for a question from its top-k chunks.
 
-    def _find_most_relevant_chunk(self, chunks: List[str], question: str) -> str:
-        """Find the most relevant chunk for a question (simplified)."""
-        # TODO: Implement proper semantic similarity search
-        return chunks[0]
+        Returns the context, a citation for each chunk it draws on and its
+        size in tokens. Falls back to the first chunk when retrieval finds
+        nothing.
+        """
+        table = self._chunk_table(text, chunks)
+        mode = mode or self.retrieval_mode
+        with timed("qa", "retrieve"):
+            hits = index.search(question, self.top_k, mode) if index is not None else []
+        # Keep document order so the context reads naturally
+        ids = sorted(chunk_id for chunk_id, _ in hits) or [0]
+        return self._pack_context(question, text, table, ids, self.context_tokens)
 
-    def _parse_qa_response(self, response: str) -> Tuple[str, str]:
-        """Parse the QA response into answer and justification."""
+    async def aselect_context(self, text: str, question: str, chunks: Optional[ChunkTable] = None,
+                              index: Optional[ChunkRetriever] = None,
+                              mode: Optional[str] = None) -> Tuple[str, List[Dict], int]:
+        """select_context on the executor: retrieval and packing are CPU work."""
+        return await run_blocking(self.select_context, text, question, chunks, index, mode)
+
+    def _pack_context(self, question: str, text: str, table: ChunkTable, ids: List[int],
+                      budget: int) -> Tuple[str, List[Dict], int]:
+        """Pack chunks into the token budget (or join them whole when packing is off)."""
+        passages = table.texts(text, ids)
+        if self.context_packing:
+            with timed("qa", "pack_context"):
+                packed = pack_context(question, passages, budget)
+            context, ids, tokens = packed.text, [ids[p] for p in packed.passages], packed.tokens
+        else:
+            context = "\n\n".join(passages)
+            tokens = estimate_tokens(context)
+        CONTEXT_TOKENS.observe(tokens)
+        return context, [table.citation(i) for i in ids], tokens
+
+    def _chunk_table(self, text: str, chunks: Optional[ChunkTable] = None) -> ChunkTable:
+        """The document's stored chunk table, or one built on the spot for callers without it."""
+        if chunks is not None:
+            return chunks
+        with timed("qa", "chunk"):
+            return build_chunk_table(text)
+
+    def parse_qa_response(self, response: str) -> Tuple[str, str]:
+        """Parse a QA completion (streamed or not) into answer and justification."""
         answer_match = re.search(r"Answer:\s*(.*?)\s*Support:", response, re.DOTALL)
         support_match = re.search(r"Support:\s*(.*?)\s*Confidence:", response, re.DOTALL)
         
@@ -180,6 +444,16 @@ class QASystem:
         
         return answer, support
 
+    def _parse_batch_qa_response(self, response: str) -> Dict[int, Tuple[str, str]]:
+        """Split a combined QA response into {question number: (answer, justification)}."""
+        parsed = {}
+        parts = re.split(r"^\s*#*\s*Q(\d+)\.?\s*$", response, flags=re.MULTILINE)
+        # re.split yields [preamble, number, block, number, block, ...]
+        for number, block in zip(parts[1::2], parts[2::2]):
+            if "Answer:" in block:
+                parsed.setdefault(int(number), self.parse_qa_response(block))
+        return parsed
+
     def _parse_generated_questions(self, response: str) -> List[str]:
         """Parse generated questions from the LLM response."""
         questions = []
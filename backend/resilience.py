@@ -0,0 +1,385 @@
+"""Tail-latency control for LLM calls.
+
+Every completion runs under a deadline. Retryable failures (429, 5xx,
+timeouts, dropped connections) are retried with jittered exponential
+backoff, honouring ``Retry-After``. A per-model circuit breaker stops
+sending traffic to a model that keeps failing, and the models in
+OPENROUTER_FALLBACK_MODELS are tried in order once the primary is out of
+retries or its breaker is open. Calls can optionally be hedged: when a
+request is slower than the recent p95 a duplicate is sent and the first
+answer wins. Streams are retried only until their first token arrives.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from backend.metrics import LLM_BREAKER_STATE, LLM_RESILIENCE_EVENTS
+
+# Seconds a completion may take end to end, across retries and fallbacks (time to first token for streams)
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+# Retries per model after the first attempt, and the backoff bounds between them
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+# Hedged requests (whole completions, not streams): off unless LLM_HEDGE=1
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+# Consecutive failures that open a model's breaker, and seconds before it lets a probe through
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+# Comma-separated models tried in order after the primary one
+OPENROUTER_FALLBACK_MODELS = [
+    model.strip() for model in os.getenv("OPENROUTER_FALLBACK_MODELS", "").split(",") if model.strip()
+]
+
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(ValueError):
+    """A failed completion; ``retryable`` errors are worth another attempt."""
+
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = False,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class LLMUnavailableError(LLMError):
+    """Every model failed or was short-circuited within the deadline; maps to HTTP 503."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def error_for_status(status: int, body: str, retry_after: Optional[str] = None) -> LLMError:
+    return LLMError(
+        f"OpenRouter API Error: {body}",
+        status=status,
+        retryable=status in RETRYABLE_STATUSES,
+        retry_after=parse_retry_after(retry_after)
+    )
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures -> half-open (one probe) after a cool-down."""
+
+    CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+
+    def __init__(self, model: str, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_timeout: float = LLM_BREAKER_RESET):
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._set_state(self.HALF_OPEN)
+            # Half-open: a single probe decides whether the model is back
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            if self.state != self.CLOSED:
+                self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._set_state(self.OPEN)
+                LLM_RESILIENCE_EVENTS.inc(event="breaker_opened", model=self.model)
+
+    def release(self) -> None:
+        """Give up a half-open probe without a verdict (the attempt was cancelled or crashed)."""
+        with self._lock:
+            self._probing = False
+
+    def retry_after(self) -> float:
+        """Seconds until the breaker lets a probe through (0 when not open)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def _set_state(self, state: int) -> None:
+        self.state = state
+        LLM_BREAKER_STATE.set(state, model=self.model)
+
+
+class LatencyWindow:
+    """Recent successful latencies, for the hedging threshold."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _CallPlan:
+    """Which model to try next, and how long to wait, for one logical completion."""
+
+    def __init__(self, resilience: "LLMResilience", models: List[str]):
+        self.resilience = resilience
+        self.models = models
+        self.index = 0
+        self.attempt = 0
+        self.expires_at = time.monotonic() + resilience.deadline
+        self.last_error: Optional[LLMError] = None
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def next_model(self) -> str:
+        while self.index < len(self.models):
+            model = self.models[self.index]
+            if self.remaining() <= 0:
+                LLM_RESILIENCE_EVENTS.inc(event="deadline_exceeded", model=model)
+                raise self._unavailable(f"LLM deadline of {self.resilience.deadline:g}s exceeded")
+            if self.resilience.breaker(model).allow():
+                return model
+            LLM_RESILIENCE_EVENTS.inc(event="breaker_rejected", model=model)
+            self._fall_back(model)
+        raise self._unavailable("No LLM model is available")
+
+    def succeeded(self, model: str) -> None:
+        self.resilience.breaker(model).record_success()
+
+    def abandoned(self, model: str) -> None:
+        # Cancelled or crashed outside the transport: no verdict, but the probe slot must not leak
+        self.resilience.breaker(model).release()
+
+    def failed(self, model: str, error: LLMError) -> float:
+        """Seconds to wait before the next attempt; re-raises errors that retrying cannot fix."""
+        breaker = self.resilience.breaker(model)
+        if not error.retryable:
+            # The model answered, so it is healthy even though the request was bad
+            breaker.record_success()
+            raise error
+        breaker.record_failure()
+        self.last_error = error
+        self.attempt += 1
+        if self.attempt <= self.resilience.max_retries:
+            delay = self.resilience.backoff(self.attempt, error.retry_after)
+            if delay is not None and delay < self.remaining():
+                LLM_RESILIENCE_EVENTS.inc(event="retry", model=model)
+                return delay
+        self._fall_back(model)
+        return 0.0
+
+    def _fall_back(self, model: str) -> None:
+        self.index += 1
+        self.attempt = 0
+        if self.index < len(self.models):
+            LLM_RESILIENCE_EVENTS.inc(event="fallback", model=model)
+
+    def _unavailable(self, reason: str) -> LLMUnavailableError:
+        detail = f"{reason}: {self.last_error}" if self.last_error else reason
+        retry_after = min((self.resilience.breaker(model).retry_after() for model in self.models), default=0.0)
+        return LLMUnavailableError(detail, status=503, retryable=True, retry_after=retry_after or None)
+
+
+class LLMResilience:
+    """Deadlines, retries, hedging, circuit breaking and model fallback around one transport."""
+
+    def __init__(self, deadline: float = LLM_DEADLINE, max_retries: int = LLM_MAX_RETRIES,
+                 base_delay: float = LLM_RETRY_BASE_DELAY, max_delay: float = LLM_RETRY_MAX_DELAY,
+                 hedge: bool = LLM_HEDGE, hedge_quantile: float = LLM_HEDGE_QUANTILE,
+                 hedge_min_delay: float = LLM_HEDGE_MIN_DELAY, hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+                 fallback_models: Optional[List[str]] = None):
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.fallback_models = OPENROUTER_FALLBACK_MODELS if fallback_models is None else fallback_models
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[Tuple[str, str], LatencyWindow] = {}
+        self._lock = threading.Lock()
+
+    def models(self, primary: str) -> List[str]:
+        return [primary] + [model for model in self.fallback_models if model != primary]
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(model, CircuitBreaker(model))
+        return breaker
+
+    def latencies(self, operation: str, model: str) -> LatencyWindow:
+        key = (operation, model)
+        window = self._latencies.get(key)
+        if window is None:
+            with self._lock:
+                window = self._latencies.setdefault(key, LatencyWindow())
+        return window
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """Full-jitter exponential delay, at least Retry-After; None when the server asks for too long."""
+        if retry_after is not None and retry_after > self.max_delay:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return max(delay, retry_after or 0.0)
+
+    def hedge_delay(self, operation: str, model: str) -> Optional[float]:
+        if not self.hedge:
+            return None
+        quantile = self.latencies(operation, model).quantile(self.hedge_quantile, self.hedge_min_samples)
+        return None if quantile is None else max(self.hedge_min_delay, quantile)
+
+    async def acall(self, operation: str, primary: str, send: Callable[[str, float], Awaitable[str]]) -> str:
+        """Run send(model, timeout) until it succeeds, a fallback succeeds, or the deadline passes.
+
+        Each attempt may be hedged and is cancelled at the deadline.
+        """
+        plan = _CallPlan(self, self.models(primary))
+        while True:
+            model = plan.next_model()
+            start = time.monotonic()
+            try:
+                result = await self._hedged(operation, model, send, plan.remaining())
+            except LLMError as e:
+                delay = plan.failed(model, e)
+                if delay:
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # Includes CancelledError (a coalesced caller or SSE client went away, or shutdown)
+                plan.abandoned(model)
+                raise
+            plan.succeeded(model)
+            self.latencies(operation, model).add(time.monotonic() - start)
+            return result
+
+    async def _hedged(self, operation: str, model: str, send: Callable[[str, float], Awaitable[str]],
+                      timeout: float) -> str:
+        expires_at = time.monotonic() + timeout
+        delay = self.hedge_delay(operation, model)
+        tasks = [asyncio.ensure_future(send(model, timeout))]
+        try:
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    LLM_RESILIENCE_EVENTS.inc(event="hedge", model=model)
+                    tasks.append(asyncio.ensure_future(send(model, expires_at - time.monotonic())))
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(0.0, expires_at - time.monotonic()), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        if task is not tasks[0]:
+                            LLM_RESILIENCE_EVENTS.inc(event="hedge_won", model=model)
+                        return task.result()
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            LLM_RESILIENCE_EVENTS.inc(event="timeout", model=model)
+            raise LLMError(f"LLM request timed out after {timeout:.1f}s", retryable=True)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def astream(self, operation: str, primary: str,
+                      open_stream: Callable[[str, float], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """Yield a stream's items; failures before the first item are retried like ``acall``.
+
+        The deadline bounds the time to the first item.
+        """
+        plan = _CallPlan(self, self.models(primary))
+        while True:
+            model = plan.next_model()
+            start = time.monotonic()
+            stream = open_stream(model, plan.remaining())
+            try:
+                first = await asyncio.wait_for(stream.__anext__(), timeout=max(0.0, plan.remaining()))
+            except StopAsyncIteration:
+                first = None
+            except asyncio.TimeoutError:
+                await stream.aclose()
+                LLM_RESILIENCE_EVENTS.inc(event="timeout", model=model)
+                plan.failed(model, LLMError("LLM stream produced no output before the deadline", retryable=True))
+                continue
+            except LLMError as e:
+                delay = plan.failed(model, e)
+                if delay:
+                    await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                plan.abandoned(model)
+                raise
+            plan.succeeded(model)
+            self.latencies(operation, model).add(time.monotonic() - start)
+            if first is not None:
+                yield first
+                async for item in stream:
+                    yield item
+            return
+
+
+_resilience: Optional[LLMResilience] = None
+_resilience_lock = threading.Lock()
+
+
+def get_resilience() -> LLMResilience:
+    """Return the process-wide policy, so breakers and latency windows are shared by all clients."""
+    global _resilience
+    if _resilience is None:
+        with _resilience_lock:
+            if _resilience is None:
+                _resilience = LLMResilience()
+    return _resilience
@@ -0,0 +1,306 @@
+import logging
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Very common words carry no ranking signal and only bloat the postings
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being
+below between both but by can could did do does doing down during each few for from further
+had has have having he her here hers him his how i if in into is it its itself just me more
+most my no nor not now of off on once only or other our out over own same she should so some
+such than that the their them then there these they this those through to too under until up
+very was we were what when where which while who whom why will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into index terms, dropping stopwords."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 inverted index over the chunks of a single document.
+
+    Postings are stored CSR-style in flat NumPy arrays: the postings of term
+    ``t`` live in ``chunk_ids[offsets[t]:offsets[t + 1]]`` with the matching
+    precomputed BM25 weights (idf included) in ``weights``. A query is then
+    just a few slice-and-add operations over a dense score vector.
+    """
+
+    def __init__(self, vocab: Dict[str, int], offsets: np.ndarray, chunk_ids: np.ndarray,
+                 weights: np.ndarray, num_chunks: int):
+        self.vocab = vocab
+        self.offsets = offsets
+        self.chunk_ids = chunk_ids
+        self.weights = weights
+        self.num_chunks = num_chunks
+
+    @classmethod
+    def build(cls, chunks: List[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Build the index from a list of chunk strings."""
+        term_postings: Dict[str, List[Tuple[int, int]]] = {}
+        lengths = np.zeros(len(chunks), dtype=np.float32)
+        for chunk_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            lengths[chunk_id] = sum(counts.values())
+            for term, tf in counts.items():
+                term_postings.setdefault(term, []).append((chunk_id, tf))
+
+        n = len(chunks)
+        avg_len = float(lengths.mean()) if n and lengths.sum() else 1.0
+        norm = k1 * (1 - b + b * lengths / avg_len)
+
+        vocab: Dict[str, int] = {}
+        offsets = np.zeros(len(term_postings) + 1, dtype=np.int64)
+        total = sum(len(p) for p in term_postings.values())
+        chunk_ids = np.empty(total, dtype=np.int32)
+        weights = np.empty(total, dtype=np.float32)
+
+        pos = 0
+        for term_id, (term, postings) in enumerate(term_postings.items()):
+            vocab[term] = term_id
+            ids = np.fromiter((c for c, _ in postings), dtype=np.int32, count=len(postings))
+            tfs = np.fromiter((tf for _, tf in postings), dtype=np.float32, count=len(postings))
+            df = len(postings)
+            idf = np.log(1 + (n - df + 0.5) / (df + 0.5))
+            end = pos + len(postings)
+            chunk_ids[pos:end] = ids
+            weights[pos:end] = idf * tfs * (k1 + 1) / (tfs + norm[ids])
+            offsets[term_id + 1] = end
+            pos = end
+
+        return cls(vocab, offsets, chunk_ids, weights, n)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Return the BM25 score of every chunk for the query."""
+        scores = np.zeros(self.num_chunks, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            # Each chunk appears at most once per term, so fancy-index add is safe
+            scores[self.chunk_ids[start:end]] += self.weights[start:end]
+        return scores
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        """Return up to top_k (chunk_id, score) pairs, best first; empty if nothing matches."""
+        scores = self.scores(query)
+        return top_k_from_scores(scores, top_k)
+
+
+def top_k_from_scores(scores: np.ndarray, top_k: int) -> List[Tuple[int, float]]:
+    """Select the top_k positive scores with a partial sort, best first; ties go to the earlier chunk."""
+    if top_k <= 0 or scores.size == 0:
+        return []
+    k = min(top_k, scores.size)
+    kth = np.partition(scores, scores.size - k)[scores.size - k]
+    # Every chunk tied with the k-th score, in chunk order, so the stable sort breaks ties by id
+    candidates = np.flatnonzero((scores >= kth) & (scores > 0))
+    candidates = candidates[np.argsort(-scores[candidates], kind="stable")][:k]
+    return [(int(i), float(scores[i])) for i in candidates]
+
+
+RETRIEVAL_MODES = ("first", "lexical", "dense", "hybrid")
+
+# Where dense chunk matrices are persisted between restarts
+INDEX_DIR = os.getenv("INDEX_DIR", ".index_cache")
+
+
+class HashingEmbedder:
+    """Deterministic feature-hashing vectorizer (unigrams + bigrams), no model download needed."""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hash{dim}"
+
+    def _features(self, text: str) -> Counter:
+        tokens = tokenize(text)
+        features = Counter(tokens)
+        features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into an L2-normalised (len(texts), dim) float32 matrix."""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                # crc32 is stable across processes, unlike the builtin hash()
+                h = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                matrix[row, h % self.dim] += sign * (1.0 + np.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU sentence-transformers model (optional dependency)."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+def get_embedder():
+    """Return the configured embedder, preferring a local model when EMBEDDING_MODEL is set."""
+    global _embedder
+    if _embedder is None:
+        # Ingestion and requests can ask at once; load the model only once
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = _build_embedder()
+    return _embedder
+
+
+def _build_embedder():
+    model_name = os.getenv("EMBEDDING_MODEL")
+    if model_name:
+        try:
+            return SentenceTransformerEmbedder(model_name)
+        except ImportError:
+            logger.warning("sentence-transformers not installed; using hashing embedder")
+    return HashingEmbedder(int(os.getenv("EMBEDDING_DIM", "512")))
+
+
+class DenseIndex:
+    """Contiguous float32 matrix of chunk embeddings, searched with one matrix product.
+
+    A persisted matrix is pickled as its key and embedder name only and
+    memory-mapped from INDEX_DIR when unpickled, wherever that process has
+    it. If the file is gone (cache wiped, another host) or was written by a
+    different embedder, ``matrix`` is None and the owning ChunkRetriever
+    drops back to lexical retrieval instead of failing the load.
+    """
+
+    def __init__(self, matrix: Optional[np.ndarray], embedder, key: Optional[str] = None):
+        self.matrix = matrix
+        self.embedder = embedder
+        # Set when the matrix is persisted under INDEX_DIR
+        self.key = key
+
+    @staticmethod
+    def _path(key: str, embedder_name: str) -> str:
+        return os.path.join(INDEX_DIR, f"{key}.{embedder_name}.npy")
+
+    def __getstate__(self):
+        if self.key:
+            return {"key": self.key, "embedder": self.embedder.name}
+        return {"matrix": np.asarray(self.matrix)}
+
+    def __setstate__(self, state):
+        self.key = state.get("key")
+        self.embedder = get_embedder()
+        self.matrix = state.get("matrix")
+        if self.key is None:
+            return
+        if state["embedder"] != self.embedder.name:
+            logger.warning("Dense index %s was built by %s, not %s; using lexical retrieval",
+                           self.key, state["embedder"], self.embedder.name)
+            return
+        try:
+            self.matrix = np.load(self._path(self.key, self.embedder.name), mmap_mode="r")
+        except (OSError, ValueError):
+            logger.warning("Dense index %s is missing from %s; using lexical retrieval", self.key, INDEX_DIR)
+
+    @classmethod
+    def build(cls, chunks: List[str], embedder=None) -> "DenseIndex":
+        embedder = embedder or get_embedder()
+        return cls(np.ascontiguousarray(embedder.embed(chunks), dtype=np.float32), embedder)
+
+    @classmethod
+    def load_or_build(cls, key: str, chunks: List[str], embedder=None) -> "DenseIndex":
+        """Memory-map a persisted matrix for key, or embed the chunks and persist them."""
+        embedder = embedder or get_embedder()
+        path = cls._path(key, embedder.name)
+        if os.path.exists(path):
+            matrix = np.load(path, mmap_mode="r")
+            if matrix.shape[0] == len(chunks):
+                return cls(matrix, embedder, key)
+        index = cls.build(chunks, embedder)
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        # Write then rename so a concurrent reader never maps a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, index.matrix)
+        os.replace(tmp_path, path)
+        return cls(np.load(path, mmap_mode="r"), embedder, key)
+
+    def scores_many(self, queries: List[str]) -> np.ndarray:
+        """Cosine scores of every chunk for each query, shape (len(queries), num_chunks)."""
+        return self.embedder.embed(queries) @ self.matrix.T
+
+    def search(self, query: str, top_k: int = 3) -> List[Tuple[int, float]]:
+        return top_k_from_scores(self.scores_many([query])[0], top_k)
+
+
+class ChunkRetriever:
+    """Per-document retrieval over the lexical and (optional) dense chunk indexes."""
+
+    def __init__(self, lexical: BM25Index, dense: Optional[DenseIndex] = None):
+        self.lexical = lexical
+        self.dense = dense
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # The dense matrix could not be mapped here; lexical retrieval still works
+        if self.dense is not None and self.dense.matrix is None:
+            self.dense = None
+
+    def search(self, query: str, top_k: int = 3, mode: str = "lexical") -> List[Tuple[int, float]]:
+        """Return up to top_k (chunk_id, score) pairs for the retrieval mode, best first."""
+        if mode == "first":
+            return []
+        if mode == "lexical" or self.dense is None:
+            return self.lexical.search(query, top_k)
+        if mode == "dense":
+            return self.dense.search(query, top_k)
+        return self._hybrid_search(query, top_k)
+
+    def search_many(self, queries: List[str], top_k: int = 3, mode: str = "lexical") -> List[List[Tuple[int, float]]]:
+        """Search several queries at once; dense scoring is a single matrix product for all of them."""
+        if mode == "first":
+            return [[] for _ in queries]
+        if mode == "lexical" or self.dense is None:
+            return [self.lexical.search(query, top_k) for query in queries]
+        depth = top_k if mode == "dense" else max(top_k * 4, 20)
+        dense_hits = [top_k_from_scores(row, depth) for row in self.dense.scores_many(queries)]
+        if mode == "dense":
+            return dense_hits
+        return [
+            self._fuse(self.lexical.search(query, depth), hits, top_k)
+            for query, hits in zip(queries, dense_hits)
+        ]
+
+    def _hybrid_search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        depth = max(top_k * 4, 20)
+        return self._fuse(self.lexical.search(query, depth), self.dense.search(query, depth), top_k)
+
+    @staticmethod
+    def _fuse(lexical_hits: List[Tuple[int, float]], dense_hits: List[Tuple[int, float]], top_k: int,
+              rrf_k: int = 60) -> List[Tuple[int, float]]:
+        """Fuse lexical and dense rankings with reciprocal rank fusion."""
+        fused: Dict[int, float] = {}
+        for hits in (lexical_hits, dense_hits):
+            for rank, (chunk_id, _) in enumerate(hits):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
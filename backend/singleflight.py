@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from backend.metrics import SINGLEFLIGHT_CALLS
+
+T = TypeVar("T")
+
+
+def normalize_text(text: str) -> str:
+    """Case- and whitespace-insensitive form of a question or answer, for coalescing keys."""
+    return " ".join(text.lower().split()).rstrip("?.! ")
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesce concurrent identical work: callers with the same key share one in-flight computation.
+
+    ``do`` is for coroutines: the work runs as its own task, every caller
+    awaits it through ``asyncio.shield`` and gets the same result or
+    exception. A caller that is cancelled only stops waiting; the work is
+    cancelled once no caller is left. Nothing is kept once the work
+    completes, so this never serves stale results (that is the LLM cache's
+    job).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # Tasks belong to one event loop, so calls are keyed per loop
+        self._async_calls: Dict[Tuple[int, Hashable], _AsyncCall] = {}
+        self._lock = threading.Lock()
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        flight_key = (id(asyncio.get_running_loop()), key)
+        with self._lock:
+            call = self._async_calls.get(flight_key)
+            if call is None:
+                call = _AsyncCall(asyncio.ensure_future(func()))
+                self._async_calls[flight_key] = call
+                call.task.add_done_callback(lambda _, c=call: self._forget(self._async_calls, flight_key, c))
+                role = "leader"
+            else:
+                role = "shared"
+        SINGLEFLIGHT_CALLS.inc(group=self.name, role=role)
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, calls: Dict, key: Hashable, call: Any) -> None:
+        with self._lock:
+            if calls.get(key) is call:
+                del calls[key]
@@ -0,0 +1,192 @@
+import asyncio
+import hashlib
+import os
+import zlib
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from backend.retrieval import tokenize
+from backend.utils import count_words, split_sentences
+
+# Concurrent LLM calls per map/reduce level
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "16"))
+# Largest amount of text (in characters) packed into one summarisation prompt
+SUMMARY_PROMPT_CHARS = int(os.getenv("SUMMARY_PROMPT_CHARS", "12000"))
+# Sentences in the local extractive summary shown until the LLM summary is ready
+EXTRACTIVE_SUMMARY_SENTENCES = int(os.getenv("EXTRACTIVE_SUMMARY_SENTENCES", "6"))
+# Candidate sentences ranked by TextRank; longer documents are sampled evenly (the graph is quadratic)
+EXTRACTIVE_MAX_SENTENCES = int(os.getenv("EXTRACTIVE_MAX_SENTENCES", "1500"))
+
+_SENTENCE_VECTOR_DIM = 1024
+_TEXTRANK_DAMPING = 0.85
+_TEXTRANK_ITERATIONS = 50
+_TEXTRANK_TOLERANCE = 1e-6
+# Fragments (headings, captions, reference entries) and run-on extraction artefacts make poor summary sentences
+_MIN_SENTENCE_WORDS = 6
+_DUPLICATE_SIMILARITY = 0.6
+_MAX_SENTENCE_WORDS = 80
+
+MAP_TEMPLATE = """
+Summarize the key points of this part of an academic text in 3-5 sentences.
+Keep names, numbers and findings that matter.
+
+{context}
+
+Summary:
+"""
+
+REDUCE_TEMPLATE = """
+The following are summaries of consecutive parts of one academic text.
+Merge them into a single coherent summary that keeps the most important points.
+
+{context}
+
+Summary:
+"""
+
+
+def chunk_key(chunk: str) -> str:
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+
+class SummaryEngine:
+    """Hierarchical map-reduce summarisation with bounded concurrency.
+
+    Each chunk is summarised independently (map), the partial summaries are
+    packed into prompts of at most ``prompt_chars`` characters and merged
+    level by level (reduce), and the last level is rendered with the final
+    prompt. Map results are kept in a caller-supplied dict keyed by chunk
+    hash, so re-summarising with a different final prompt or word limit only
+    repeats the cheap reduce phase.
+    """
+
+    def __init__(self, llm, final_prompt: str, concurrency: int = SUMMARY_CONCURRENCY,
+                 prompt_chars: int = SUMMARY_PROMPT_CHARS):
+        self.llm = llm
+        self.concurrency = concurrency
+        self.prompt_chars = prompt_chars
+        self.final_prompt = final_prompt
+
+    async def asummarize(self, chunks: List[str], map_cache: Optional[Dict[str, str]] = None, **final_inputs) -> str:
+        """Summarise the whole document; extra keyword inputs go to the final prompt."""
+        chunks = [chunk for chunk in chunks if chunk.strip()]
+        if not chunks:
+            raise ValueError("Empty text provided for summarization")
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        # Short documents fit in one prompt: a single round-trip
+        if sum(len(chunk) for chunk in chunks) <= self.prompt_chars:
+            return (await self._run(self.final_prompt, semaphore, " ".join(chunks), final_inputs)).strip()
+
+        partials = await self._map(chunks, semaphore, map_cache if map_cache is not None else {})
+        groups = self._pack(partials)
+        while len(groups) > 1:
+            partials = await asyncio.gather(*(self._run(REDUCE_TEMPLATE, semaphore, group) for group in groups))
+            next_groups = self._pack([p.strip() for p in partials])
+            if len(next_groups) >= len(groups):
+                # Reduce outputs are not shrinking; stop before looping forever
+                groups = ["\n\n".join(next_groups)[:self.prompt_chars]]
+                break
+            groups = next_groups
+        return (await self._run(self.final_prompt, semaphore, groups[0], final_inputs)).strip()
+
+    async def _map(self, chunks: List[str], semaphore: asyncio.Semaphore, map_cache: Dict[str, str]) -> List[str]:
+        keys = [chunk_key(chunk) for chunk in chunks]
+        missing = {key: chunk for key, chunk in zip(keys, chunks) if key not in map_cache}
+        results = await asyncio.gather(*(self._run(MAP_TEMPLATE, semaphore, chunk) for chunk in missing.values()))
+        for key, result in zip(missing, results):
+            map_cache[key] = result.strip()
+        return [map_cache[key] for key in keys]
+
+    def _pack(self, partials: List[str]) -> List[str]:
+        """Group consecutive partial summaries into prompts within the size budget."""
+        groups, current, size = [], [], 0
+        for partial in partials:
+            if current and size + len(partial) > self.prompt_chars:
+                groups.append("\n\n".join(current))
+                current, size = [], 0
+            current.append(partial[:self.prompt_chars])
+            size += len(current[-1]) + 2
+        if current:
+            groups.append("\n\n".join(current))
+        return groups
+
+    async def _run(self, template: str, semaphore: asyncio.Semaphore, context: str,
+                   extra: Optional[Dict] = None) -> str:
+        async with semaphore:
+            return await self.llm.ainvoke(template.format(context=context, **(extra or {})))
+
+
+def _sentence_vectors(sentences: List[str], dim: int = _SENTENCE_VECTOR_DIM) -> np.ndarray:
+    """L2-normalised TF-IDF term vectors, hashed into dim columns."""
+    buckets: Dict[str, int] = {}
+    rows, cols = [], []
+    for row, sentence in enumerate(sentences):
+        for term in set(tokenize(sentence)):
+            bucket = buckets.get(term)
+            if bucket is None:
+                bucket = buckets[term] = zlib.crc32(term.encode("utf-8")) % dim
+            rows.append(row)
+            cols.append(bucket)
+    matrix = np.zeros((len(sentences), dim), dtype=np.float32)
+    np.add.at(matrix, (rows, cols), 1.0)
+    # Terms in every sentence say nothing about centrality
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    matrix *= (np.log((len(sentences) + 1) / (document_frequency + 1)) + 1).astype(np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def textrank(similarity: np.ndarray, damping: float = _TEXTRANK_DAMPING) -> np.ndarray:
+    """PageRank scores over a sentence similarity graph, by power iteration."""
+    n = similarity.shape[0]
+    weights = np.clip(similarity, 0.0, None)
+    np.fill_diagonal(weights, 0.0)
+    out_degree = weights.sum(axis=1, keepdims=True)
+    # Isolated sentences spread their rank uniformly instead of losing it
+    transition = np.where(out_degree > 0, weights / np.where(out_degree > 0, out_degree, 1.0), 1.0 / n)
+    transition = transition.T.astype(np.float32)
+    scores = np.full(n, 1.0 / n, dtype=np.float32)
+    for _ in range(_TEXTRANK_ITERATIONS):
+        updated = (1 - damping) / n + damping * (transition @ scores)
+        if np.abs(updated - scores).sum() < _TEXTRANK_TOLERANCE:
+            return updated
+        scores = updated
+    return scores
+
+
+def extractive_summary(text: str, max_sentences: int = EXTRACTIVE_SUMMARY_SENTENCES,
+                       max_words: Optional[int] = None) -> str:
+    """Local summary: the most central sentences (TextRank), in document order.
+
+    Runs on the CPU in milliseconds, so a summary is available as soon as the
+    text is extracted, long before the LLM summary.
+    """
+    sentences = split_sentences(" ".join(text.split()))
+    candidates = [s for s in sentences if _MIN_SENTENCE_WORDS <= count_words(s) <= _MAX_SENTENCE_WORDS]
+    if not candidates:
+        candidates = sentences
+    if not candidates:
+        return ""
+    if len(candidates) > EXTRACTIVE_MAX_SENTENCES:
+        step = len(candidates) / EXTRACTIVE_MAX_SENTENCES
+        candidates = [candidates[int(i * step)] for i in range(EXTRACTIVE_MAX_SENTENCES)]
+
+    vectors = _sentence_vectors(candidates)
+    scores = textrank(vectors @ vectors.T)
+
+    chosen, words = [], 0
+    for i in np.argsort(-scores, kind="stable"):
+        length = count_words(candidates[i])
+        if max_words is not None and chosen and words + length > max_words:
+            continue
+        # Near-duplicates: repeated boilerplate, or the same sentence extracted twice
+        if chosen and float((vectors[chosen] @ vectors[i]).max()) > _DUPLICATE_SIMILARITY:
+            continue
+        chosen.append(int(i))
+        words += length
+        if len(chosen) >= max_sentences:
+            break
+    return " ".join(candidates[i] for i in sorted(chosen))
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import BinaryIO, Iterable, NamedTuple, Optional
+
+from fastapi import HTTPException
+
+# Largest accepted upload request body, in bytes
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+# Uploads are copied to disk this many bytes at a time
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+# Where spooled uploads wait for ingestion (default: the system temp directory)
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+
+class SpooledUpload(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+
+
+def spool_upload(source: BinaryIO, max_bytes: int = UPLOAD_MAX_BYTES,
+                 chunk_size: int = UPLOAD_CHUNK_SIZE) -> SpooledUpload:
+    """Copy an upload to a temporary file in fixed-size chunks, hashing it on the way.
+
+    Blocking; run it off the event loop. The caller owns the returned file
+    and must remove it (see ``discard``). Raises 413 as soon as more than
+    ``max_bytes`` have been read.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(prefix="upload-", dir=UPLOAD_TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=too_large_message(max_bytes))
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        discard(path)
+        raise
+    return SpooledUpload(path, size, digest.hexdigest())
+
+
+def discard(path: Optional[str]) -> None:
+    """Remove a spooled upload; missing files are fine."""
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def too_large_message(max_bytes: int) -> str:
+    return f"File too large (limit {max_bytes} bytes)"
+
+
+class UploadSizeLimit:
+    """ASGI middleware rejecting upload bodies over ``max_bytes`` with 413 while they arrive.
+
+    A declared Content-Length over the limit is refused before any of the
+    body is read; otherwise bytes are counted as the server hands them over
+    and the request is cut off at the first chunk past the limit, so an
+    oversized file is never buffered or spooled in full.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = UPLOAD_MAX_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request" and not rejected:
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    rejected = True
+                    await self._reject(send)
+                    # The app sees a disconnect and stops parsing
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            # The 413 is already out; drop whatever the app answers to the cut-off body
+            if not rejected:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
+
+    async def _reject(self, send) -> None:
+        body = json.dumps({"detail": too_large_message(self.max_bytes)}).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                        (b"connection", b"close")],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -12,15 +12,6 @@ def count_words(text: str) -> int:
     """Count words in a string"""
     return len(text.split())
 
-def extract_relevant_section(text: str, keywords: list) -> str:
-    """
-    Extract the most relevant section containing the keywords
-    """
-    sentences = re.split(r'(?<=[.!?]) +', text)
-    relevant_sentences = []
-    
-    for sentence in sentences:
-        if any(keyword.lower() in sentence.lower() for keyword in keywords):
-            relevant_sentences.append(sentence)
-    
-    return ' '.join(relevant_sentences) if relevant_sentences else text[:500]
\ No newline at end of file
+def split_sentences(text: str) -> list:
+    """Split whitespace-normalised text into sentences"""
+    return [sentence for sentence in re.split(r'(?<=[.!?]) +', text) if sentence.strip()]
\ No newline at end of file
@@ -0,0 +1,72 @@
+"""Import-time budget for the API module.
+
+Imports the app module in fresh interpreters, reports the median wall time
+and the slowest modules from ``python -X importtime``, and exits 1 when the
+median exceeds the budget, so a heavy import sneaking back onto the startup
+path fails CI:
+
+    python -m bench.import_time
+    python -m bench.import_time --budget 0.6 --runs 7 --top 15
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import List, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Seconds; the web framework alone accounts for most of it
+IMPORT_BUDGET = float(os.getenv("IMPORT_BUDGET", "0.8"))
+
+_TIMER = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+def time_import(module: str) -> float:
+    """Seconds to import module in a fresh interpreter (interpreter startup excluded)."""
+    result = subprocess.run(
+        [sys.executable, "-c", _TIMER.format(module=module)],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(module: str, top: int) -> List[Tuple[int, str]]:
+    """(self microseconds, module) for the modules that take longest to execute."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the import time of the API module against a budget")
+    parser.add_argument("--module", default="backend.main")
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET, help="seconds allowed for the median import")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest modules to list")
+    args = parser.parse_args()
+
+    times = [time_import(args.module) for _ in range(args.runs)]
+    median = statistics.median(times)
+    print(f"import {args.module}: median {median * 1000:.0f} ms over {args.runs} runs "
+          f"(min {min(times) * 1000:.0f} ms, budget {args.budget * 1000:.0f} ms)")
+    print("slowest modules (self time):")
+    for self_us, name in slowest_imports(args.module, args.top):
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    if median > args.budget:
+        print(f"FAIL: import time is over budget by {(median - args.budget) * 1000:.0f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""Load and latency benchmark for backend.main:app.
+
+Starts the stub LLM (bench/stub_llm.py) and a uvicorn server on localhost,
+uploads synthetic documents and drives the upload, ask, challenge and
+evaluate workloads at a fixed concurrency. Latency percentiles are recorded
+per endpoint and per stage (from the Server-Timing header and the ingestion
+job status), and the results are written as JSON so two runs can be compared:
+
+    python -m bench.run --documents 8 --doc-words 20000 --concurrency 16 --output new.json
+    python -m bench.run --compare old.json --output new.json
+
+Use --base-url to benchmark a server that is already running instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from bench.stub_llm import StubConfig, start_stub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKLOADS = ("upload", "ask", "challenge", "evaluate")
+
+# Vocabulary for synthetic documents; a fixed seed keeps runs comparable
+WORDS = (
+    "model data results analysis method sample study effect network energy protein cell signal "
+    "memory learning training error rate variance control group measure theory system process "
+    "structure function response temperature pressure growth factor layer surface particle field "
+    "evidence hypothesis experiment observation parameter estimate distribution regression cluster"
+).split()
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def summarize_latencies(values_ms: List[float]) -> Dict:
+    return {
+        "count": len(values_ms),
+        "mean_ms": round(sum(values_ms) / len(values_ms), 2) if values_ms else None,
+        "p50_ms": percentile(values_ms, 50),
+        "p95_ms": percentile(values_ms, 95),
+        "p99_ms": percentile(values_ms, 99),
+        "max_ms": max(values_ms) if values_ms else None,
+    }
+
+
+def make_document(rng: random.Random, words: int) -> str:
+    sentences = []
+    while words > 0:
+        length = min(words, rng.randint(8, 20))
+        sentence = " ".join(rng.choice(WORDS) for _ in range(length))
+        sentences.append(sentence.capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+def make_pdf(text: str, words_per_page: int = 400) -> bytes:
+    """Write a minimal text-only PDF (Helvetica, one content stream per page)."""
+    tokens = text.split()
+    pages = [" ".join(tokens[i:i + words_per_page]) for i in range(0, len(tokens), words_per_page)] or [""]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            " ".join(f"{4 + 2 * i} 0 R" for i in range(len(pages))), len(pages))).encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i, page in enumerate(pages):
+        page = page.replace("\\", "").replace("(", "").replace(")", "")
+        lines = [page[j:j + 90] for j in range(0, len(page), 90)]
+        stream = ("BT /F1 10 Tf 40 780 Td 12 TL " + " ".join(f"({line}) '" for line in lines) + " ET").encode()
+        objects.append((
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        ).encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = b"%PDF-1.4\n"
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + obj + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return out
+
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    timings = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                try:
+                    timings[name] = float(value)
+                except ValueError:
+                    pass
+    return timings
+
+
+class Recorder:
+    """Collects per-request latencies, statuses and Server-Timing stages per endpoint."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.stages: Dict[str, Dict[str, List[float]]] = {}
+        self.windows: Dict[str, List[float]] = {}
+
+    def record(self, endpoint: str, started: float, status: str,
+               response: Optional[httpx.Response] = None) -> None:
+        finished = time.perf_counter()
+        self.latencies.setdefault(endpoint, []).append(round((finished - started) * 1000, 3))
+        counts = self.statuses.setdefault(endpoint, {})
+        counts[status] = counts.get(status, 0) + 1
+        window = self.windows.setdefault(endpoint, [started, finished])
+        window[0], window[1] = min(window[0], started), max(window[1], finished)
+        if response is not None and "server-timing" in response.headers:
+            stages = self.stages.setdefault(endpoint, {})
+            for name, duration in parse_server_timing(response.headers["server-timing"]).items():
+                stages.setdefault(name, []).append(duration)
+
+    def add_stage(self, endpoint: str, name: str, duration_ms: float) -> None:
+        self.stages.setdefault(endpoint, {}).setdefault(name, []).append(duration_ms)
+
+    def results(self) -> Dict:
+        endpoints = {}
+        for endpoint, values in self.latencies.items():
+            statuses = self.statuses[endpoint]
+            start, end = self.windows[endpoint]
+            errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+            endpoints[endpoint] = {
+                **summarize_latencies(values),
+                "errors": errors,
+                "statuses": statuses,
+                "throughput_rps": round(len(values) / (end - start), 3) if end > start else None,
+            }
+        stages = {
+            endpoint: {name: summarize_latencies(values) for name, values in names.items()}
+            for endpoint, names in self.stages.items()
+        }
+        return {"endpoints": endpoints, "stages": stages}
+
+
+async def timed_request(client: httpx.AsyncClient, recorder: Recorder, endpoint: str,
+                        method: str, url: str, **kwargs) -> Optional[httpx.Response]:
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        recorder.record(endpoint, started, type(e).__name__)
+        return None
+    recorder.record(endpoint, started, str(response.status_code), response)
+    return response
+
+
+async def wait_until_ready(client: httpx.AsyncClient, recorder: Recorder, doc_id: str, started: float,
+                           timeout: float) -> bool:
+    """Poll /status until ingestion finishes; records time-to-ready and per-stage durations.
+
+    Returns whether the document can take questions, which is still the case
+    when only summarisation failed (e.g. under an injected LLM error rate).
+    """
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        response = await client.get(f"/status/{doc_id}")
+        if response.status_code == 200:
+            body = response.json()
+            if body["status"] in ("completed", "failed"):
+                recorder.record("upload_ready", started, "200" if body["status"] == "completed" else "failed")
+                for name, stage in body.get("stages", {}).items():
+                    if stage.get("duration") is not None:
+                        recorder.add_stage("upload_ready", name, stage["duration"] * 1000)
+                return body["ready_for_questions"]
+        await asyncio.sleep(0.05)
+    recorder.record("upload_ready", started, "timeout")
+    return False
+
+
+async def run_workloads(args, base_url: str) -> Dict:
+    rng = random.Random(args.seed)
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    headers = {"Cache-Control": "no-cache"} if args.no_cache else {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits, headers=headers) as client:
+        # Upload always runs: the other workloads need documents
+        async def upload(i: int) -> Optional[str]:
+            text = make_document(rng, args.doc_words)
+            if args.format == "pdf":
+                files = {"file": (f"bench-{i}.pdf", make_pdf(text), "application/pdf")}
+            else:
+                files = {"file": (f"bench-{i}.txt", text.encode("utf-8"), "text/plain")}
+            async with semaphore:
+                started = time.perf_counter()
+                response = await timed_request(client, recorder, "upload", "POST", "/upload/", files=files)
+            if response is None or response.status_code not in (200, 202):
+                return None
+            doc_id = response.json()["doc_id"]
+            ready = await wait_until_ready(client, recorder, doc_id, started, args.timeout)
+            return doc_id if ready else None
+
+        doc_ids = [doc_id for doc_id in await asyncio.gather(*(upload(i) for i in range(args.documents))) if doc_id]
+        if not doc_ids:
+            raise RuntimeError("No document finished ingestion; check the server log")
+
+        async def ask(i: int) -> None:
+            question = f"What does the study say about {rng.choice(WORDS)} and {rng.choice(WORDS)}?"
+            async with semaphore:
+                await timed_request(client, recorder, "ask", "POST", f"/ask/{doc_ids[i % len(doc_ids)]}",
+                                    params={"question": question})
+
+        async def challenge(i: int) -> None:
+            async with semaphore:
+                await timed_request(client, recorder, "challenge", "GET", f"/challenge/{doc_ids[i % len(doc_ids)]}")
+
+        async def evaluate(i: int) -> None:
+            doc_id = doc_ids[i % len(doc_ids)]
+            async with semaphore:
+                await timed_request(client, recorder, "evaluate", "POST", f"/evaluate/{doc_id}/{i % 3}",
+                                    json={"answer": f"It is about {rng.choice(WORDS)} {rng.choice(WORDS)}."})
+
+        if "evaluate" in args.workloads and "challenge" not in args.workloads:
+            # /evaluate grades questions from the last /challenge of each document
+            await asyncio.gather(*(client.get(f"/challenge/{doc_id}") for doc_id in doc_ids))
+
+        for name, worker in (("ask", ask), ("challenge", challenge), ("evaluate", evaluate)):
+            if name in args.workloads:
+                await asyncio.gather(*(worker(i) for i in range(args.requests)))
+
+        metrics = (await client.get("/metrics")).text if args.scrape_metrics else None
+
+    results = recorder.results()
+    if metrics is not None:
+        results["metrics"] = metrics
+    return results
+
+
+def start_server(args, workdir: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENROUTER_API_KEY": "bench",
+        "OPENROUTER_API_URL": f"http://127.0.0.1:{args.stub_port}/",
+        "DOCUMENT_DB_PATH": os.path.join(workdir, "documents.sqlite3"),
+        "LLM_CACHE_PATH": os.path.join(workdir, "llm_cache.sqlite3"),
+        "LLM_CACHE_ENABLED": "1" if args.llm_cache else "0",
+        "INDEX_DIR": os.path.join(workdir, "index"),
+        "SERVER_TIMING": "1",
+    }
+    command = [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(args.port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    return subprocess.Popen(command, cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_for_server(base_url: str, process: Optional[subprocess.Popen], timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not start within {timeout}s")
+
+
+def compare(baseline: Dict, current: Dict) -> List[str]:
+    """Human-readable per-endpoint deltas of p50/p95/p99 and throughput against a baseline run."""
+    lines = []
+    for endpoint, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if before.get(key) and now.get(key) is not None:
+                deltas.append(f"{key} {before[key]:.1f} -> {now[key]:.1f} ({(now[key] / before[key] - 1) * 100:+.1f}%)")
+        lines.append(f"{endpoint:>12}: " + ", ".join(deltas))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the research assistant API against a stub LLM")
+    parser.add_argument("--base-url", default=None, help="benchmark a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--stub-port", type=int, default=8799)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS),
+                        help="comma-separated subset of: " + ", ".join(WORKLOADS))
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=50, help="requests per ask/challenge/evaluate workload")
+    parser.add_argument("--documents", type=int, default=4, help="documents uploaded")
+    parser.add_argument("--doc-words", type=int, default=5000, help="words per synthetic document")
+    parser.add_argument("--format", choices=("txt", "pdf"), default="txt")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub LLM latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--llm-cache", action="store_true", help="leave the server's LLM cache enabled")
+    parser.add_argument("--no-cache", action="store_true", help="send Cache-Control: no-cache on every request")
+    parser.add_argument("--scrape-metrics", action="store_true", help="include the final /metrics text")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default=None, help="write JSON results to this file")
+    parser.add_argument("--compare", default=None, help="baseline JSON results to compare against")
+    args = parser.parse_args()
+    args.workloads = {name.strip() for name in args.workloads.split(",") if name.strip()}
+    unknown = args.workloads - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    process = None
+    stub = None
+    with tempfile.TemporaryDirectory(prefix="bench-") as workdir:
+        base_url = args.base_url
+        try:
+            if base_url is None:
+                stub = start_stub(args.stub_port, StubConfig(
+                    args.latency, args.jitter, args.error_rate, args.token_delay, args.seed
+                ))
+                process = start_server(args, workdir)
+                base_url = f"http://127.0.0.1:{args.port}"
+            wait_for_server(base_url, process)
+            started = time.time()
+            results = asyncio.run(run_workloads(args, base_url))
+            elapsed = time.time() - started
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+            if stub is not None:
+                stub.shutdown()
+
+    results["config"] = {
+        key: (sorted(value) if isinstance(value, set) else value)
+        for key, value in vars(args).items() if key not in ("output", "compare")
+    }
+    results["environment"] = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+    results["wall_seconds"] = round(elapsed, 3)
+
+    print(f"{'endpoint':>12} {'count':>6} {'errors':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, stats in results["endpoints"].items():
+        print(f"{endpoint:>12} {stats['count']:>6} {stats['errors']:>6} {stats['throughput_rps'] or 0:>8.2f} "
+              f"{stats['p50_ms'] or 0:>9.1f} {stats['p95_ms'] or 0:>9.1f} {stats['p99_ms'] or 0:>9.1f}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print("\nCompared with", args.compare)
+        for line in compare(baseline, results):
+            print(line)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Local stand-in for the OpenRouter chat-completions API, for benchmarks.
+
+Replies are shaped after the prompt (summary, QA, question generation,
+evaluation) so the backend's parsers see realistic output. Latency, jitter,
+streaming speed and error rate are configurable; nothing leaves the machine.
+
+    python -m bench.stub_llm --port 8799 --latency 0.3 --jitter 0.1 --error-rate 0.01
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+
+class StubConfig:
+    def __init__(self, latency: float = 0.2, jitter: float = 0.05, error_rate: float = 0.0,
+                 token_delay: float = 0.005, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.token_delay = token_delay
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def delay(self) -> float:
+        with self.lock:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+def completion_for(prompt: str) -> str:
+    """Return a plausible completion in the format the prompt asks for."""
+    if "### Q1" in prompt:
+        numbers = re.findall(r"^\s*Q(\d+)\. ", prompt, re.MULTILINE) or ["1"]
+        return "\n".join(
+            f"### Q{n}\nAnswer: Stub answer {n}.\nSupport: Stub support {n}.\nConfidence: Medium"
+            for n in numbers
+        )
+    if "Evaluate this answer" in prompt:
+        return "Score: 4\nEvaluation: Mostly correct but misses a detail.\nIdeal Answer: The stub ideal answer."
+    if "Generate 3" in prompt:
+        return "Q1. What is the main finding?\nQ2. How was it measured?\nQ3. What are the limitations?"
+    if "Answer:" in prompt:
+        return "Answer: The stub answer.\nSupport: A supporting sentence from the text.\nConfidence: High"
+    return "This is a stub summary sentence. It stands in for the model output."
+
+
+def make_handler(config: StubConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+            with config.lock:
+                config.requests += 1
+            time.sleep(config.delay())
+
+            if config.should_fail():
+                with config.lock:
+                    config.errors += 1
+                self._send_json(503, {"error": {"code": 503, "message": "stub injected failure"}})
+                return
+
+            content = completion_for(prompt)
+            usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split())}
+            if body.get("stream"):
+                self._stream(content, usage)
+            else:
+                self._send_json(200, {"choices": [{"message": {"content": content}}], "usage": usage})
+
+        def _send_json(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, content: str, usage: dict) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            tokens = re.findall(r"\S+\s*", content)
+            events = [{"choices": [{"delta": {"content": token}}]} for token in tokens]
+            events.append({"choices": [{"delta": {}}], "usage": usage})
+            for event in events:
+                self._chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                time.sleep(config.token_delay)
+            self._chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def _chunk(self, data: bytes) -> None:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+    return Handler
+
+
+def start_stub(port: int, config: StubConfig) -> ThreadingHTTPServer:
+    """Serve the stub on 127.0.0.1:port from a daemon thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenRouter chat-completions server")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--latency", type=float, default=0.2, help="mean seconds before the first byte")
+    parser.add_argument("--jitter", type=float, default=0.05, help="uniform +/- seconds added to latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="seconds between streamed tokens")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    config = StubConfig(args.latency, args.jitter, args.error_rate, args.token_delay, args.seed)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(config))
+    server.daemon_threads = True
+    print(f"Stub LLM listening on http://127.0.0.1:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,119 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import json
+
+# Configure backend URL: BACKEND_URL environment variable or Streamlit secret,
+# e.g. BACKEND_URL=http://localhost:8000 for a local backend
+DEFAULT_BACKEND_URL = "https://believable-dream-production.up.railway.app"
+# Seconds to wait for the backend to respond (for streamed answers: between chunks)
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "120"))
+# Seconds between ingestion status checks while the LLM summary is pending
+STATUS_POLL_INTERVAL = float(os.getenv("STATUS_POLL_INTERVAL", "2"))
+# Seconds backend responses stay cached (challenge questions and evaluations)
+CACHE_TTL = int(os.getenv("CACHE_TTL", "3600"))
+
+
+def get_backend_url():
+    """Backend URL from the environment, then Streamlit secrets, then the default deployment."""
+    url = os.getenv("BACKEND_URL")
+    if not url:
+        try:
+            url = st.secrets.get("BACKEND_URL")
+        except Exception:
+            # No secrets.toml configured
+            url = None
+    return (url or DEFAULT_BACKEND_URL).rstrip("/")
+
+
+BACKEND_URL = get_backend_url()
+
+
+def get_http_session():
+    """One pooled HTTP session per user session, so requests reuse keep-alive connections."""
+    if "http" not in st.session_state:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        st.session_state.http = session
+    return st.session_state.http
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=256, show_spinner=False)
+def fetch_challenge(doc_id, _session):
+    """Challenge questions for a document, fetched once per doc_id."""
+    response = _session.get(f"{BACKEND_URL}/challenge/{doc_id}", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return response.json().get("questions", [])
+
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=1024, show_spinner=False)
+def fetch_evaluation(doc_id, question_id, answer, _session):
+    """Evaluation of one answer; resubmitting the same answer is served from the cache."""
+    response = _session.post(
+        f"{BACKEND_URL}/evaluate/{doc_id}/{question_id}",
+        json={"answer": answer},
+        timeout=REQUEST_TIMEOUT
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def iter_sse(response):
+    """Yield (event, data) pairs from a Server-Sent Events response."""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
+def render_summary():
+    """Show the current summary; a quick extractive one is flagged while the LLM summary is pending."""
+    if st.session_state.summary:
+        st.subheader("Document Summary")
+        if st.session_state.summary_kind == "extractive" and not st.session_state.processing_done:
+            st.caption("Quick extractive summary; a refined summary will replace it shortly.")
+        st.write(st.session_state.summary)
+    elif not st.session_state.processing_done:
+        st.info("Processing document...")
+
+
+@st.fragment(run_every=STATUS_POLL_INTERVAL)
+def poll_summary():
+    """Show the summary, polling ingestion status until the LLM summary replaces the extractive one.
+
+    Runs as a fragment, so polling never reruns or blocks the rest of the page.
+    Once the job has finished the whole app reruns once: the summary is then
+    rendered statically and this fragment, with its timer, is gone.
+    """
+    try:
+        response = get_http_session().get(
+            f"{BACKEND_URL}/status/{st.session_state.doc_id}", timeout=REQUEST_TIMEOUT
+        )
+        if response.status_code == 200:
+            status = response.json()
+            st.session_state.summary = status.get("summary") or st.session_state.summary
+            st.session_state.summary_kind = status.get("summary_kind")
+            if status.get("status") == "failed":
+                errors = [s["error"] for s in status.get("stages", {}).values() if s.get("error")]
+                st.session_state.processing_error = '; '.join(errors)
+                st.session_state.document_uploaded = False
+            if status.get("status") in ("completed", "failed"):
+                st.session_state.processing_done = True
+                st.rerun(scope="app")
+    except requests.RequestException:
+        # Transient; the next run polls again
+        pass
+    render_summary()
 
-# Configure backend URL
-# BACKEND_URL = "http://localhost:8000" 
-BACKEND_URL = "https://believable-dream-production.up.railway.app"
-# Update if your backend runs elsewhere
 
 # Set page config
 st.set_page_config(
@@ -58,35 +166,44 @@ def main():
     for key, value in {
         'doc_id': None,
         'document_uploaded': False,
+        'processing_done': False,
+        'processing_error': None,
         'challenge_questions': [],
         'user_answers': {},
         'evaluations': {},
-        'summary': ""
+        'answers': {},
+        'summary': "",
+        'summary_kind': None
     }.items():
         if key not in st.session_state:
             st.session_state[key] = value
 
+    session = get_http_session()
+
     st.header("1. Upload Document")
     uploaded_file = st.file_uploader("Choose a PDF or TXT file", type=["pdf", "txt"])
 
     if uploaded_file is not None:
         if st.button("Upload and Process"):
-            with st.spinner("Processing..."):
+            with st.spinner("Uploading..."):
                 try:
                     files = {"file": (uploaded_file.name, uploaded_file.getvalue(), uploaded_file.type)}
-                    response = requests.post(f"{BACKEND_URL}/upload/", files=files)
+                    response = session.post(f"{BACKEND_URL}/upload/", files=files, timeout=REQUEST_TIMEOUT)
 
-                    if response.status_code == 200:
+                    if response.status_code in (200, 202):
                         data = response.json()
                         if "doc_id" in data:
+                            # Processing continues in the background; the summary panel polls for it
                             st.session_state.doc_id = data["doc_id"]
                             st.session_state.document_uploaded = True
-                            st.session_state.summary = data.get("summary", "")
-                            st.success("File processed successfully!")
-
-                            if st.session_state.summary:
-                                st.subheader("Document Summary")
-                                st.write(st.session_state.summary)
+                            st.session_state.processing_done = False
+                            st.session_state.processing_error = None
+                            st.session_state.summary = data.get("summary") or ""
+                            st.session_state.summary_kind = data.get("summary_kind")
+                            st.session_state.challenge_questions = []
+                            st.session_state.user_answers = {}
+                            st.session_state.evaluations = {}
+                            st.success("File uploaded successfully!")
                         else:
                             st.error(f"Error processing file: {data.get('detail', 'No detail provided')}")
                     else:
@@ -94,7 +211,15 @@ def main():
                 except Exception as e:
                     st.error(f"Upload failed: {str(e)}")
 
+    if st.session_state.processing_error:
+        st.error(f"Error processing file: {st.session_state.processing_error}")
+
     if st.session_state.document_uploaded and st.session_state.doc_id:
+        if st.session_state.processing_done:
+            render_summary()
+        else:
+            poll_summary()
+
         st.header("2. Choose Interaction Mode")
         tab1, tab2 = st.tabs(["Ask Anything", "Challenge Me"])
 
@@ -102,26 +227,44 @@ def main():
         with tab1:
             st.subheader("Ask Anything")
             question = st.text_input("Enter your question about the document:")
+            answer_key = (st.session_state.doc_id, " ".join(question.lower().split()))
 
             if st.button("Get Answer", key="get_answer_button") and question:
-                with st.spinner("Finding answer..."):
+                if answer_key in st.session_state.answers:
+                    # Asked before in this session: no round-trip
+                    data = st.session_state.answers[answer_key]
+                    st.subheader("Answer")
+                    st.markdown(f"<div class='answer-box'>{data.get('answer', 'No answer returned.')}</div>", unsafe_allow_html=True)
+                    st.subheader("Justification")
+                    st.write(data.get('justification', 'No justification returned.'))
+                else:
                     try:
-                        payload = {"question": question}
-                        # response = requests.post(
-                        #     f"{BACKEND_URL}/ask/{st.session_state.doc_id}",
-                        #     json=payload
-                        # )
-                        response = requests.post(
-                            f"{BACKEND_URL}/ask/{st.session_state.doc_id}",
-                            params={"question": question}   # replace json= with params=
+                        # Stream the answer so it renders token by token
+                        response = session.post(
+                            f"{BACKEND_URL}/ask_stream/{st.session_state.doc_id}",
+                            params={"question": question},
+                            stream=True,
+                            timeout=REQUEST_TIMEOUT
                         )
 
                         if response.status_code == 200:
-                            data = response.json()
                             st.subheader("Answer")
-                            st.markdown(f"<div class='answer-box'>{data.get('answer', 'No answer returned.')}</div>", unsafe_allow_html=True)
+                            answer_box = st.empty()
                             st.subheader("Justification")
-                            st.write(data.get('justification', 'No justification returned.'))
+                            justification_box = st.empty()
+                            sections = {"answer": "", "support": ""}
+                            answer_box.markdown("<div class='answer-box'>...</div>", unsafe_allow_html=True)
+                            for event, data in iter_sse(response):
+                                if event == "delta" and data["section"] in sections:
+                                    sections[data["section"]] += data["text"]
+                                    answer_box.markdown(f"<div class='answer-box'>{sections['answer']}</div>", unsafe_allow_html=True)
+                                    justification_box.write(sections["support"])
+                                elif event == "done":
+                                    st.session_state.answers[answer_key] = data
+                                    answer_box.markdown(f"<div class='answer-box'>{data.get('answer', 'No answer returned.')}</div>", unsafe_allow_html=True)
+                                    justification_box.write(data.get('justification', 'No justification returned.'))
+                                elif event == "error":
+                                    st.error(f"Error getting answer: {data.get('detail')}")
                         else:
                             st.error(f"Error getting answer: {response.text}")
                     except Exception as e:
@@ -136,17 +279,12 @@ def main():
             if st.button("Generate Questions"):
                 with st.spinner("Generating challenge questions..."):
                     try:
-                        response = requests.get(
-                            f"{BACKEND_URL}/challenge/{st.session_state.doc_id}"
-                        )
-                        if response.status_code == 200:
-                            data = response.json()
-                            st.session_state.challenge_questions = data.get("questions", [])
-                            st.session_state.user_answers = {}
-                            st.session_state.evaluations = {}
-                            st.success("Questions generated successfully!")
-                        else:
-                            st.error(f"Error generating questions: {response.text}")
+                        st.session_state.challenge_questions = fetch_challenge(st.session_state.doc_id, session)
+                        st.session_state.user_answers = {}
+                        st.session_state.evaluations = {}
+                        st.success("Questions generated successfully!")
+                    except requests.HTTPError as e:
+                        st.error(f"Error generating questions: {e.response.text}")
                     except Exception as e:
                         st.error(f"An error occurred: {str(e)}")
 
@@ -162,17 +300,11 @@ def main():
                         if user_answer.strip():
                             with st.spinner("Evaluating your answer..."):
                                 try:
-                                    payload = {"answer": user_answer}
-                                    response = requests.post(
-                                        f"{BACKEND_URL}/evaluate/{st.session_state.doc_id}/{i}",
-                                        json=payload
-                                    )
-                                    if response.status_code == 200:
-                                        data = response.json()
-                                        st.session_state.evaluations[i] = data
-                                        st.success("Answer evaluated!")
-                                    else:
-                                        st.error(f"Error evaluating answer: {response.text}")
+                                    data = fetch_evaluation(st.session_state.doc_id, i, user_answer.strip(), session)
+                                    st.session_state.evaluations[i] = data
+                                    st.success("Answer evaluated!")
+                                except requests.HTTPError as e:
+                                    st.error(f"Error evaluating answer: {e.response.text}")
                                 except Exception as e:
                                     st.error(f"An error occurred: {str(e)}")
                         else:
@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import llm_cache
+from backend.dependencies import provide_documents, provide_qa_system
+from backend.llm_cache import LLMCache
+from backend.main import app
+from backend.openrouter_llm import OpenRouterLLM
+from backend.qa_system import QASystem
+
+
+@pytest.fixture
+def llm_calls(monkeypatch):
+    """Replace the OpenRouter transport with a canned one; returns the request bodies it received."""
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(llm_cache, "_cache", LLMCache(None))
+    calls = []
+
+    async def fake_apost(self, headers, data, model, timeout):
+        calls.append(data)
+        n = len(calls)
+        if "Generate 3" in data["messages"][0]["content"]:
+            return f"Q1. Question {n}a?\nQ2. Question {n}b?\nQ3. Question {n}c?"
+        return f"Answer: answer {n}\nSupport: support {n}\nConfidence: High"
+
+    monkeypatch.setattr(OpenRouterLLM, "_apost", fake_apost)
+    return calls
+
+
+@pytest.fixture
+def serve(llm_calls):
+    """Build a TestClient for the app backed by the given document store."""
+    qa_system = QASystem()
+
+    def make(documents) -> TestClient:
+        app.dependency_overrides[provide_documents] = lambda: documents
+        app.dependency_overrides[provide_qa_system] = lambda: qa_system
+        return TestClient(app)
+
+    yield make
+    app.dependency_overrides.clear()
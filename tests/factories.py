@@ -0,0 +1,17 @@
+from backend.chunking import build_chunk_table
+from backend.ingestion import IngestionJob
+
+
+def completed_job(doc_id: str) -> dict:
+    job = IngestionJob(doc_id)
+    for stage in job.stages:
+        job.start(stage)
+        job.finish(stage)
+    return job.to_state()
+
+
+def ready_entry(doc_id: str, text: str, index=None) -> dict:
+    """A document entry as ingestion leaves it once every stage is done."""
+    return {"text": text, "chunks": build_chunk_table(text), "index": index, "summary": None,
+            "summary_kind": None, "page_offsets": [], "failed_pages": [], "filename": f"{doc_id}.txt",
+            "upload_time": "2024-01-01T00:00:00", "job": completed_job(doc_id), "job_owner": None}
@@ -0,0 +1,18 @@
+from backend.document_store import InMemoryDocumentStore
+
+from tests.factories import ready_entry
+
+
+def test_challenge_questions_are_kept_until_refresh(serve, llm_calls):
+    documents = InMemoryDocumentStore()
+    documents.create("doc", ready_entry("doc", "Photosynthesis converts light into chemical energy."))
+    http = serve(documents)
+
+    first = http.get("/challenge/doc").json()["questions"]
+    assert http.get("/challenge/doc").json()["questions"] == first
+    assert len(llm_calls) == 1
+
+    refreshed = http.get("/challenge/doc", params={"refresh": "true"}).json()["questions"]
+    assert len(llm_calls) == 2
+    assert refreshed != first
+    assert http.get("/challenge/doc").json()["questions"] == refreshed
@@ -0,0 +1,42 @@
+import asyncio
+
+import httpx
+
+from backend import llm_cache
+from backend.document_store import InMemoryDocumentStore
+from backend.llm_cache import LLMCache, cache_bypassed
+from backend.main import app
+
+from tests.factories import ready_entry
+
+
+def test_no_cache_request_does_not_join_a_cached_one(serve, llm_calls, monkeypatch):
+    documents = InMemoryDocumentStore()
+    documents.create("doc", ready_entry("doc", "Photosynthesis converts light into chemical energy."))
+    serve(documents).post("/ask/doc", params={"question": "What is converted?"})
+    assert len(llm_calls) == 1
+
+    # Hold cached reads so the plain request is still in flight when the no-cache one arrives
+    released = asyncio.Event()
+    cached_aget = LLMCache.aget
+
+    async def slow_aget(self, key):
+        if not cache_bypassed():
+            await released.wait()
+        return await cached_aget(self, key)
+
+    monkeypatch.setattr(llm_cache.LLMCache, "aget", slow_aget)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as http:
+            params = {"question": "What is converted?"}
+            cached = asyncio.ensure_future(http.post("/ask/doc", params=params))
+            await asyncio.sleep(0.05)
+            fresh = asyncio.ensure_future(http.post("/ask/doc", params=params, headers={"Cache-Control": "no-cache"}))
+            await asyncio.sleep(0.05)
+            released.set()
+            await cached
+            return (await fresh).json()["answer"]
+
+    assert asyncio.run(scenario()) == "answer 2"
+    assert len(llm_calls) == 2
@@ -0,0 +1,32 @@
+from backend.context import estimate_tokens, pack_context
+
+QUESTION = "How do plants absorb light energy?"
+PASSAGES = [
+    "Photosynthesis converts light into chemical energy. Plants use chlorophyll to absorb light. "
+    "The weather was pleasant that day.",
+    "Mitochondria produce energy for the cell. Chlorophyll is green. Respiration releases carbon dioxide.",
+]
+
+
+def test_packed_context_stays_within_the_budget():
+    for budget in (5, 12, 20, 40, 1000):
+        packed = pack_context(QUESTION, PASSAGES, budget)
+        assert 0 < packed.tokens <= budget
+        assert estimate_tokens(packed.text.replace("[...]", "")) <= budget
+
+    assert pack_context(QUESTION, PASSAGES, 12).text == "Plants use chlorophyll to absorb light."
+    assert pack_context(QUESTION, PASSAGES, 1000).passages == [0, 1]
+
+
+def test_sentence_longer_than_the_budget_is_cut_to_its_first_words():
+    passage = " ".join(f"word{i}" for i in range(100)) + " light."
+    packed = pack_context("light", [passage], 10)
+
+    assert packed.text.startswith("word0 word1")
+    assert packed.passages == [0]
+    assert packed.tokens <= 10
+
+
+def test_no_passages_give_an_empty_context():
+    assert pack_context(QUESTION, []) == ("", [], 0)
+    assert pack_context(QUESTION, ["", "   "]) == ("", [], 0)
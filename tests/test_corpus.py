@@ -0,0 +1,28 @@
+from backend.chunking import build_chunk_table
+from backend.corpus import CorpusIndex
+from backend.document_store import SQLiteDocumentStore
+from backend.retrieval import BM25Index, ChunkRetriever
+
+
+def index_document(store, doc_id, text):
+    chunks = build_chunk_table(text)
+    store.create(doc_id, {"text": text, "chunks": chunks,
+                          "index": ChunkRetriever(BM25Index.build(chunks.texts(text)))})
+    store.record_indexed(doc_id)
+
+
+def test_sync_follows_other_workers_through_the_index_log(tmp_path):
+    path = str(tmp_path / "documents.sqlite3")
+    theirs, mine = SQLiteDocumentStore(path), SQLiteDocumentStore(path)
+    corpus = CorpusIndex()
+
+    index_document(theirs, "a", "Photosynthesis converts light into chemical energy.")
+    corpus.sync(mine)
+    assert "a" in corpus
+    assert corpus.search("photosynthesis")[0]["doc_id"] == "a"
+
+    index_document(theirs, "b", "Mitochondria produce energy for the cell.")
+    theirs.delete("a")
+    corpus.sync(mine)
+    assert "a" not in corpus
+    assert [hit["doc_id"] for hit in corpus.search("energy")] == ["b"]
@@ -0,0 +1,30 @@
+import pytest
+
+from backend.document_store import InMemoryDocumentStore, SQLiteDocumentStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryDocumentStore()
+    return SQLiteDocumentStore(str(tmp_path / "documents.sqlite3"))
+
+
+def test_update_leaves_entries_already_read_untouched(store):
+    store.create("doc", {"text": "body", "summary": "old"})
+    before = store.get("doc")
+    store.update("doc", summary="new")
+
+    assert before["summary"] == "old"
+    assert store.get("doc")["summary"] == "new"
+
+
+def test_hot_entry_is_dropped_when_another_worker_wrote(tmp_path):
+    path = str(tmp_path / "documents.sqlite3")
+    mine, theirs = SQLiteDocumentStore(path), SQLiteDocumentStore(path)
+    mine.create("doc", {"summary": "old", "questions": None})
+    mine.get("doc")
+    theirs.update("doc", questions=["Q1"])
+    mine.update("doc", summary="new")
+
+    assert mine.get("doc")["questions"] == ["Q1"]
@@ -0,0 +1,65 @@
+from backend.document_store import InMemoryDocumentStore, SQLiteDocumentStore
+from backend.ingestion import IngestionJob, IngestionPipeline
+
+
+def add_job(store, doc_id, owner, started=True):
+    job = IngestionJob(doc_id)
+    if started:
+        job.start("extract")
+    store.create(doc_id, {"filename": f"{doc_id}.txt", "text": None, "job": job.to_state(), "job_owner": owner})
+
+
+def job_status(store, doc_id):
+    return IngestionJob.from_state(store.get(doc_id)["job"]).status
+
+
+def check_orphans_are_failed(store):
+    add_job(store, "dead", "host:1:dead")
+    add_job(store, "queued", "host:1:dead", started=False)
+    add_job(store, "peer", "host:2:live")
+    store.heartbeat("host:2:live")
+    pipeline = IngestionPipeline(None, None, store, None)
+
+    assert pipeline.recover_orphans() == 2
+    assert job_status(store, "dead") == "failed"
+    assert job_status(store, "queued") == "failed"
+    assert job_status(store, "peer") == "running"
+    assert [doc_id for doc_id, _, _ in store.unfinished_jobs()] == ["peer"]
+
+
+def test_orphaned_jobs_are_failed_in_memory():
+    check_orphans_are_failed(InMemoryDocumentStore())
+
+
+def test_orphaned_jobs_are_failed_in_sqlite(tmp_path):
+    check_orphans_are_failed(SQLiteDocumentStore(str(tmp_path / "documents.sqlite3")))
+
+
+def test_jobs_with_a_live_task_are_left_alone(tmp_path):
+    store = SQLiteDocumentStore(str(tmp_path / "documents.sqlite3"))
+    pipeline = IngestionPipeline(None, None, store, None)
+    add_job(store, "mine", pipeline.owner)
+    pipeline._running.add("mine")
+
+    assert pipeline.recover_orphans() == 0
+    assert job_status(store, "mine") == "running"
+
+
+def test_duplicates_only_alias_onto_live_or_completed_documents():
+    store = InMemoryDocumentStore()
+    pipeline = IngestionPipeline(None, None, store, None)
+    add_job(store, "orphan", "host:1:dead")
+    store.register_content("raw:orphan", "orphan")
+    add_job(store, "mine", pipeline.owner)
+    pipeline._running.add("mine")
+    store.register_content("raw:mine", "mine")
+    done = IngestionJob("done")
+    for stage in done.stages:
+        done.start(stage)
+        done.finish(stage)
+    store.create("done", {"job": done.to_state(), "job_owner": None})
+    store.register_content("raw:done", "done")
+
+    assert pipeline.find_duplicate("raw:orphan") is None
+    assert pipeline.find_duplicate("raw:mine") == "mine"
+    assert pipeline.find_duplicate("raw:done") == "done"
@@ -0,0 +1,36 @@
+import random
+
+from backend.keywords import KeywordHit, KeywordMatcher
+
+
+def naive_hits(keywords, text, whole_words=False):
+    hits = []
+    folded = text.lower()
+    for keyword in {keyword.strip() for keyword in keywords if keyword.strip()}:
+        pattern = keyword.lower()
+        for start in range(len(text) - len(pattern) + 1):
+            end = start + len(pattern)
+            if folded[start:end] != pattern:
+                continue
+            if whole_words and ((start and text[start - 1].isalnum()) or (end < len(text) and text[end].isalnum())):
+                continue
+            hits.append(KeywordHit(start, end, keyword))
+    return sorted(hits)
+
+
+def test_matches_naive_search_on_random_text():
+    rng = random.Random(0)
+    for _ in range(2000):
+        # A tiny alphabet makes overlapping and nested keywords ("a", "aba", "ABAB") common
+        keywords = ["".join(rng.choice("abAB") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 6))]
+        text = "".join(rng.choice("abAB ") for _ in range(rng.randint(0, 40)))
+        for whole_words in (False, True):
+            matcher = KeywordMatcher(keywords, whole_words)
+            assert sorted(matcher.finditer(text)) == naive_hits(keywords, text, whole_words), (keywords, text)
+
+
+def test_overlapping_and_case_folded_keywords():
+    matcher = KeywordMatcher(["he", "she", "HERS", "his"])
+    hits = [(hit.start, hit.end, hit.keyword) for hit in matcher.finditer("uSHErs")]
+
+    assert hits == [(1, 4, "she"), (2, 4, "he"), (2, 6, "HERS")]
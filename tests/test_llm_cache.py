@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from backend import llm_cache
+from backend.llm_cache import LLMCache, reset_cache_bypass, set_cache_bypass
+from backend.openrouter_llm import OpenRouterLLM
+
+
+def test_entries_evicted_from_memory_are_promoted_back_from_sqlite(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite3"), memory_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+    assert "a" not in cache._memory
+
+    assert cache.get("a") == "A"
+    assert cache.stats["disk_hits"] == 1
+    assert "a" in cache._memory and "b" not in cache._memory
+    assert cache.get("a") == "A"
+    assert cache.stats["memory_hits"] == 1
+
+
+def test_expired_entries_are_misses_in_both_tiers(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = LLMCache(path, ttl=60)
+    cache.set("key", "value")
+    later = time.time() + 61
+    monkeypatch.setattr(llm_cache.time, "time", lambda: later)
+
+    assert cache.get("key") is None
+    assert LLMCache(path).get("key") is None
+    assert cache.stats["misses"] == 1
+
+
+def test_bypass_skips_reads_for_the_current_context_only(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite3"))
+    cache.set("key", "value")
+
+    token = set_cache_bypass(True)
+    try:
+        assert cache.get("key") is None
+        assert contextvars.Context().run(cache.get, "key") == "value"
+    finally:
+        reset_cache_bypass(token)
+    assert cache.get("key") == "value"
+    assert cache.stats["bypassed"] == 1
+
+
+def test_bypassed_call_refreshes_the_stored_completion(tmp_path, monkeypatch, llm_calls):
+    path = str(tmp_path / "cache.sqlite3")
+    monkeypatch.setattr(llm_cache, "_cache", LLMCache(path))
+    llm = OpenRouterLLM()
+
+    async def ask(bypass=False):
+        token = set_cache_bypass(bypass)
+        try:
+            return await llm.ainvoke("What is photosynthesis?")
+        finally:
+            reset_cache_bypass(token)
+
+    assert asyncio.run(ask()) == asyncio.run(ask())
+    assert len(llm_calls) == 1
+    fresh = asyncio.run(ask(bypass=True))
+    assert len(llm_calls) == 2
+    assert asyncio.run(ask()) == fresh
+    # Another worker reading the file sees the refreshed completion too
+    data = llm_calls[-1]
+    assert LLMCache(path).get(LLMCache.make_key(data["model"], data["messages"][0]["content"])) == fresh
+
+
+def test_workers_share_the_file_under_concurrent_access(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    # Two processes' caches over one WAL file; each thread writes through one and reads through the other
+    caches = [LLMCache(path, memory_entries=4), LLMCache(path, memory_entries=4)]
+    errors = []
+
+    def work(worker):
+        writer, reader = caches[worker % 2], caches[(worker + 1) % 2]
+        try:
+            for i in range(100):
+                writer.set(f"{worker}:{i}", f"value {worker}:{i}")
+                assert reader.get(f"{worker}:{i}") == f"value {worker}:{i}"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert all(LLMCache(path).get(f"{worker}:{i}") is not None for worker in range(4) for i in range(100))
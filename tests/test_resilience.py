@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from backend.resilience import CircuitBreaker, LLMResilience, LLMUnavailableError
+
+
+def open_breaker(resilience: LLMResilience, model: str) -> CircuitBreaker:
+    breaker = resilience.breaker(model)
+    breaker.opened_at = -breaker.reset_timeout  # cool-down already over
+    breaker._set_state(CircuitBreaker.OPEN)
+    return breaker
+
+
+def test_cancelled_half_open_probe_releases_the_breaker():
+    resilience = LLMResilience(max_retries=0, fallback_models=[])
+    breaker = open_breaker(resilience, "m")
+
+    async def hang(model, timeout):
+        await asyncio.sleep(60)
+
+    async def answer(model, timeout):
+        return "ok"
+
+    async def scenario():
+        probe = asyncio.ensure_future(resilience.acall("test", "m", hang))
+        await asyncio.sleep(0.01)
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        # The next caller gets the probe slot instead of "No LLM model is available"
+        return await resilience.acall("test", "m", answer)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_crashing_outside_the_transport_releases_the_breaker():
+    resilience = LLMResilience(max_retries=0, fallback_models=[])
+    breaker = open_breaker(resilience, "m")
+
+    async def crash(model, timeout):
+        raise KeyError("bug")
+
+    async def answer(model, timeout):
+        return "ok"
+
+    with pytest.raises(KeyError):
+        asyncio.run(resilience.acall("test", "m", crash))
+    assert asyncio.run(resilience.acall("test", "m", answer)) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_concurrent_half_open_callers_are_rejected_while_probing():
+    resilience = LLMResilience(max_retries=0, fallback_models=[])
+    open_breaker(resilience, "m")
+
+    async def hang(model, timeout):
+        await asyncio.sleep(60)
+
+    async def scenario():
+        probe = asyncio.ensure_future(resilience.acall("test", "m", hang))
+        await asyncio.sleep(0.01)
+        with pytest.raises(LLMUnavailableError):
+            await resilience.acall("test", "m", hang)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+    asyncio.run(scenario())
@@ -0,0 +1,98 @@
+import math
+import pickle
+
+import numpy as np
+import pytest
+
+from backend import retrieval
+from backend.document_store import SQLiteDocumentStore
+from backend.qa_system import QASystem
+from backend.retrieval import BM25Index, ChunkRetriever, DenseIndex, top_k_from_scores
+
+from tests.factories import ready_entry
+
+TEXT = ("Photosynthesis converts light into chemical energy. " * 40
+        + "Mitochondria produce energy for the cell through respiration. " * 40)
+
+
+def test_dense_index_is_pickled_by_key_and_resolved_against_index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "INDEX_DIR", str(tmp_path / "before"))
+    index = DenseIndex.load_or_build("doc", ["light energy", "cell respiration"])
+    blob = pickle.dumps(index)
+    assert str(tmp_path).encode() not in blob
+
+    (tmp_path / "before").rename(tmp_path / "after")
+    monkeypatch.setattr(retrieval, "INDEX_DIR", str(tmp_path / "after"))
+    assert pickle.loads(blob).search("cell respiration", 1)[0][0] == 1
+
+
+def test_missing_dense_matrix_falls_back_to_lexical_retrieval(tmp_path, monkeypatch, serve):
+    monkeypatch.setattr(retrieval, "INDEX_DIR", str(tmp_path / "index"))
+    path = str(tmp_path / "documents.sqlite3")
+    entry = ready_entry("doc", TEXT)
+    index = QASystem().build_index(entry["chunks"].texts(TEXT), "doc")
+    assert index.dense is not None
+    SQLiteDocumentStore(path).create("doc", {**entry, "index": index})
+
+    for npy in (tmp_path / "index").iterdir():
+        npy.unlink()
+    # A fresh store has nothing decoded yet, as in another worker or after a restart
+    http = serve(SQLiteDocumentStore(path))
+
+    assert http.get("/status/doc").json()["status"] == "completed"
+    response = http.post("/ask/doc", params={"question": "What do mitochondria produce?", "mode": "hybrid"})
+    assert response.status_code == 200
+    assert response.json()["sources"]
+
+
+# Lengths 2, 3 and 1 tokens (average 2); k1 = 1.5 and b = 0.75
+CHUNKS = ["apple banana", "apple apple cherry", "banana"]
+
+
+def bm25(tf, length, df, n=3, avg_len=2, k1=1.5, b=0.75):
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_len))
+
+
+def test_bm25_scores_match_the_formula():
+    index = BM25Index.build(CHUNKS)
+
+    assert index.scores("apple") == pytest.approx([bm25(1, 2, 2), bm25(2, 3, 2), 0], rel=1e-6)
+    assert index.scores("banana cherry") == pytest.approx(
+        [bm25(1, 2, 2), bm25(1, 3, 1), bm25(1, 1, 2)], rel=1e-6
+    )
+
+
+def test_bm25_ranks_best_first_and_skips_non_matches():
+    index = BM25Index.build(CHUNKS)
+
+    assert [chunk_id for chunk_id, _ in index.search("apple", 3)] == [1, 0]
+    assert [chunk_id for chunk_id, _ in index.search("banana cherry", 3)] == [1, 2, 0]
+    assert index.search("durian", 3) == []
+    # Stopwords are not indexed, so they cannot match anything
+    assert index.search("the and", 3) == []
+
+
+def test_top_k_breaks_ties_by_chunk_order():
+    scores = np.array([0, 2, 1, 2, 0, 2, 1], dtype=np.float32)
+
+    assert top_k_from_scores(scores, 2) == [(1, 2.0), (3, 2.0)]
+    assert top_k_from_scores(scores, 4) == [(1, 2.0), (3, 2.0), (5, 2.0), (2, 1.0)]
+
+
+def test_top_k_larger_than_the_corpus_returns_every_match():
+    scores = np.array([0.5, 0, 3], dtype=np.float32)
+
+    assert top_k_from_scores(scores, 10) == [(2, 3.0), (0, 0.5)]
+    assert top_k_from_scores(scores, 0) == []
+    assert top_k_from_scores(np.zeros(0, dtype=np.float32), 3) == []
+
+
+def test_reciprocal_rank_fusion_order():
+    lexical = [(3, 9.0), (1, 5.0), (2, 1.0)]
+    dense = [(1, 0.9), (4, 0.8)]
+
+    fused = ChunkRetriever._fuse(lexical, dense, top_k=4)
+    assert [chunk_id for chunk_id, _ in fused] == [1, 3, 4, 2]
+    assert [score for _, score in fused] == pytest.approx([1 / 62 + 1 / 61, 1 / 61, 1 / 62, 1 / 63])
+    assert ChunkRetriever._fuse(lexical, dense, top_k=2) == fused[:2]
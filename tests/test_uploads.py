@@ -0,0 +1,75 @@
+import asyncio
+import hashlib
+import io
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from backend import uploads
+from backend.uploads import UploadSizeLimit, spool_upload
+
+
+def run_limited(body_chunks, headers=(), max_bytes=10):
+    """Send a request through UploadSizeLimit; returns the messages sent and the body parts the app read."""
+    read = []
+
+    async def app(scope, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                raise RuntimeError("client disconnected")
+            read.append(message["body"])
+            if not message.get("more_body"):
+                break
+        await send({"type": "http.response.start", "status": 202, "headers": []})
+        await send({"type": "http.response.body", "body": b"accepted"})
+
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(body_chunks) - 1}
+                for i, chunk in enumerate(body_chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "path": "/upload/", "headers": list(headers)}
+    asyncio.run(UploadSizeLimit(app, ["/upload/"], max_bytes)(scope, receive, send))
+    return sent, read
+
+
+def test_declared_length_over_the_limit_is_rejected_before_reading():
+    sent, read = run_limited([b"x" * 11], headers=[(b"content-length", b"11")])
+
+    assert sent[0]["status"] == 413
+    assert json.loads(sent[1]["body"])["detail"] == "File too large (limit 10 bytes)"
+    assert read == []
+
+
+def test_chunked_body_is_cut_off_once_it_passes_the_limit():
+    sent, read = run_limited([b"abcd", b"efgh", b"ijkl", b"mnop"])
+
+    assert [message["status"] for message in sent if message["type"] == "http.response.start"] == [413]
+    assert read == [b"abcd", b"efgh"]
+
+
+def test_body_within_the_limit_reaches_the_app():
+    sent, read = run_limited([b"abcd", b"efgh"], headers=[(b"content-length", b"8")])
+
+    assert sent[0]["status"] == 202
+    assert read == [b"abcd", b"efgh"]
+
+
+def test_spooled_file_is_removed_when_the_upload_is_too_large(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "UPLOAD_TMP_DIR", str(tmp_path))
+
+    with pytest.raises(HTTPException) as error:
+        spool_upload(io.BytesIO(b"x" * 100), max_bytes=10, chunk_size=4)
+    assert error.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+    upload = spool_upload(io.BytesIO(b"x" * 10), max_bytes=10, chunk_size=4)
+    assert upload.size == 10 and upload.sha256 == hashlib.sha256(b"x" * 10).hexdigest()
+    assert open(upload.path, "rb").read() == b"x" * 10